@@ -0,0 +1,169 @@
+"""
+Сколько стоит разбор одного ответа пользователя.
+
+Запуск:
+    python -m benchmarks.answer_parse_bench --questions 1000 --rounds 20
+
+Сравнивает прежний разбор (выбор обработчика по типу вопроса на каждое
+сообщение, перебор форматов даты через `strptime`, поиск по спискам
+`SAY_YES`/`SAY_NO`) с парсерами, скомпилированными вместе с формой.
+Ответы — смесь принятых и отклоненных для каждого типа вопроса.
+Результат — JSON: время на ответ в наносекундах и время компиляции
+парсеров на всю форму.
+
+Отдельно замеряется поиск варианта по названию в вопросе с `--options`
+вариантами: название в другом регистре, название с опечаткой и первое
+слово названия, которое подходит к нескольким вариантам.
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.session_state_bench import build_form
+from services.models import FormItem
+from utils.answer_parsers import ChoiceParser, compile_parser
+from utils.constants import SAY_NO, SAY_YES
+from utils.form_utils import compile_form
+
+
+INPUTS = {
+    'enum': ['2', '1, 3', '9', '0'],
+    'boolean': ['да', 'Нет', '1', 'может быть'],
+    'date': ['01.02.2023', '2023-02-01', '1/2/2023', '31.02.2023', 'вчера'],
+    'string': ['  Хочу работать с людьми  ', 'Нет'],
+}
+
+
+def legacy_parse(user_input: str, question: FormItem):
+    """Разбор ответа так, как он был устроен до компиляции парсеров"""
+    if question.type == 'enum' and question.items:
+        try:
+            if question.widget == 'radio':
+                choice_index = int(user_input) - 1
+                if 0 <= choice_index < len(question.items):
+                    return [question.items[choice_index].id]
+                return None
+            selected_ids = []
+            for choice_str in re.findall(r'\d+', user_input):
+                choice_index = int(choice_str) - 1
+                if 0 <= choice_index < len(question.items):
+                    selected_ids.append(question.items[choice_index].id)
+            return selected_ids or None
+        except ValueError:
+            return None
+    elif question.type == 'boolean':
+        user_input_lower = user_input.lower().strip()
+        if user_input_lower in SAY_YES:
+            return True
+        elif user_input_lower in SAY_NO:
+            return False
+        try:
+            return bool(int(user_input))
+        except ValueError:
+            return None
+    elif question.type == 'date':
+        user_input = user_input.strip()
+        for date_format in ('%d.%m.%Y', '%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(
+                    user_input, date_format
+                ).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+        return None
+    elif question.type == 'string':
+        return user_input.strip()
+    return user_input
+
+
+def per_answer_ns(parse: Callable[[int, str], object],
+                  answers: List[Tuple[int, str]], rounds: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(rounds):
+        for index, user_input in answers:
+            parse(index, user_input)
+    return round((time.perf_counter_ns() - started) / (rounds * len(answers)))
+
+
+PLACES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург',
+          'Казань', 'Нижний Новгород', 'Челябинск', 'Самара', 'Омск',
+          'Ростов-на-Дону', 'Уфа', 'Красноярск', 'Воронеж', 'Пермь']
+KINDS = ['район', 'область', 'центр', 'филиал', 'офис', 'отделение']
+
+
+def label_queries(options: int) -> Tuple[List[str], List[str]]:
+    """Подписи вариантов и ответы текстом к ним"""
+    rng = random.Random(0)
+    labels = [f'{rng.choice(PLACES)} {rng.choice(KINDS)} № {number}'
+              for number in range(1, options + 1)]
+    queries = []
+    for label in rng.sample(labels, min(options, 200)):
+        queries.append(label.upper())
+        queries.append(label[:2] + label[3:])
+        queries.append(label.split()[0])
+    return labels, queries
+
+
+def label_matching(options: int) -> Dict[str, object]:
+    labels, queries = label_queries(options)
+    parser = ChoiceParser(tuple(map(str, range(options))), labels,
+                          multiple=False)
+    timings, reasons = [], {}
+    for query in queries:
+        started = time.perf_counter_ns()
+        result = parser.parse(query)
+        timings.append(time.perf_counter_ns() - started)
+        reason = result.reason or 'ok'
+        reasons[reason] = reasons.get(reason, 0) + 1
+    cuts = statistics.quantiles(timings, n=100)
+    return {
+        'options': options,
+        'p50_us': round(cuts[49] / 1e3, 1),
+        'p99_us': round(cuts[98] / 1e3, 1),
+        'results': reasons,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--options', type=int, default=300)
+    args = parser.parse_args()
+
+    compiled = compile_form(build_form(args.questions))
+    questions = compiled.questions
+    answers = [
+        (index, user_input)
+        for index, question in enumerate(questions)
+        for user_input in INPUTS.get(question.type, ['ответ'])
+    ]
+
+    started = time.perf_counter_ns()
+    parsers = [compile_parser(question) for question in questions]
+    compile_ns = time.perf_counter_ns() - started
+
+    results: Dict[str, object] = {
+        'questions': args.questions,
+        'answers': len(answers) * args.rounds,
+        'legacy_ns_per_answer': per_answer_ns(
+            lambda index, text: legacy_parse(text, questions[index]),
+            answers, args.rounds
+        ),
+        'compiled_ns_per_answer': per_answer_ns(
+            lambda index, text: parsers[index].parse(text),
+            answers, args.rounds
+        ),
+        'compile_ms_per_form': round(compile_ns / 1e6, 3),
+        'label_matching': label_matching(args.options),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
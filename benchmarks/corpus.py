@@ -0,0 +1,66 @@
+from typing import List
+
+from services.models import FormItem, ItemOption, Validation
+from utils.constants import (BEGIN, HELP_TEXT, INSTRUCTION_TEXT, NOT_OK, OK,
+                             PLEASE_COMPLETE, PRIVACY_TEXT, QUESTION_OK)
+from utils.form_utils import format_question_text
+
+
+STATIC_TEXTS = [
+    OK, NOT_OK, BEGIN, QUESTION_OK,
+    INSTRUCTION_TEXT, HELP_TEXT, PLEASE_COMPLETE, PRIVACY_TEXT,
+]
+
+OPTION_LABELS = [
+    'Среднее общее', 'Среднее профессиональное', 'Высшее образование',
+    'Неоконченное высшее', 'Ученая степень', 'Другое',
+    'Затрудняюсь ответить', 'Не хочу отвечать',
+]
+
+
+def synthetic_questions() -> List[FormItem]:
+    """Вопросы всех поддерживаемых типов с разным числом вариантов."""
+    required = [Validation(type='required')]
+    questions = []
+    for widget in ('radio', 'checkbox', None):
+        for options_count in (3, len(OPTION_LABELS)):
+            questions.append(FormItem(
+                id=f'enum_{widget}_{options_count}',
+                label='Какое у вас образование?',
+                hidden=False,
+                type='enum',
+                widget=widget,
+                items=[
+                    ItemOption(id=str(i), label=label)
+                    for i, label in enumerate(
+                        OPTION_LABELS[:options_count]
+                    )
+                ],
+                validations=required,
+            ))
+    questions.append(FormItem(
+        id='boolean', label='Вы согласны с условиями участия?',
+        hidden=False, type='boolean', validations=required,
+    ))
+    questions.append(FormItem(
+        id='date', label='Укажите дату рождения',
+        hidden=False, type='date',
+    ))
+    for multiline in (False, True):
+        questions.append(FormItem(
+            id=f'string_{multiline}',
+            label='Расскажите, какая работа вам интересна',
+            hidden=False, type='string', multiline=multiline,
+            comment='Можно ответить коротко',
+        ))
+    return questions
+
+
+def build_corpus() -> List[str]:
+    """Тексты для замеров: константы бота и вопросы форм."""
+    questions = synthetic_questions()
+    prompts = [
+        format_question_text(question, number, len(questions))
+        for number, question in enumerate(questions, 1)
+    ]
+    return STATIC_TEXTS + prompts
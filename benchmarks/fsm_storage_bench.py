@@ -0,0 +1,99 @@
+"""
+Задержка чтения и записи сессий FSM в разных хранилищах.
+
+Запуск:
+    python -m benchmarks.fsm_storage_bench --sessions 1000 --steps 20 \\
+        --redis-url redis://localhost:6379/15
+
+Для каждого хранилища (память, SQLite и Redis, если задан `--redis-url`)
+сессии проходят `steps` шагов анкеты: чтение данных и запись ответа,
+как в `handle_user_answer`. Отдельно замеряется холодное чтение после
+перезапуска, когда данных еще нет в кэше. Результат — JSON
+с перцентилями задержки в микросекундах.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from services.fsm_storage import RedisStorage, RespClient, SQLiteStorage
+
+
+def summary(values: List[float]) -> Dict[str, float]:
+    cuts = statistics.quantiles(values, n=100)
+    return {
+        'p50_us': round(cuts[49] * 1e6, 1),
+        'p99_us': round(cuts[98] * 1e6, 1),
+        'mean_us': round(statistics.fmean(values) * 1e6, 1),
+    }
+
+
+async def timed(samples: List[float], coro) -> object:
+    started = time.perf_counter()
+    result = await coro
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+async def run(make_storage: Callable[[], BaseStorage],
+              sessions: int, steps: int) -> Dict:
+    keys = [StorageKey(bot_id=1, chat_id=i, user_id=i)
+            for i in range(sessions)]
+    reads, writes, cold_reads = [], [], []
+
+    storage = make_storage()
+    for key in keys:
+        await storage.set_data(key, {'form_id': 'bench', 'form_version': 'v1',
+                                     'current_index': 0, 'answers': {}})
+    for step in range(steps):
+        for key in keys:
+            data = await timed(reads, storage.get_data(key))
+            data['answers'][f'question_{step}'] = 'ответ'
+            data['current_index'] = step + 1
+            await timed(writes, storage.set_data(key, data))
+    await storage.close()
+
+    if isinstance(storage, MemoryStorage):
+        return {'read': summary(reads), 'write': summary(writes)}
+
+    storage = make_storage()
+    for key in keys:
+        await timed(cold_reads, storage.get_data(key))
+    await storage.close()
+    return {
+        'read': summary(reads),
+        'write': summary(writes),
+        'cold_read': summary(cold_reads),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--redis-url', default='')
+    args = parser.parse_args()
+
+    results = {'sessions': args.sessions, 'steps': args.steps}
+    results['memory'] = await run(MemoryStorage, args.sessions, args.steps)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fsm.sqlite3')
+        results['sqlite'] = await run(lambda: SQLiteStorage(path),
+                                      args.sessions, args.steps)
+    if args.redis_url:
+        results['redis'] = await run(
+            lambda: RedisStorage(RespClient.from_url(args.redis_url)),
+            args.sessions, args.steps
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Сколько памяти выделяется на клавиатуру одного ответа бота.
+
+Запуск:
+    python -m benchmarks.keyboard_alloc_bench --updates 10000
+
+Обновления повторяют заполнение формы: клавиатуры вопросов
+(`get_keyboard_for_question`) и наборы `BUTTONS`. Прежний способ строит
+`ReplyKeyboardBuilder` и разметку на каждое обновление, новый
+(`reply_keyboard`) возвращает общую разметку. По tracemalloc
+считаются блоки и байты памяти на каждую выданную клавиатуру, плюс
+время на обновление.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Sequence
+
+from aiogram.types import ReplyKeyboardMarkup
+
+from keyboard.reply_kb import ReplyBuilder, reply_keyboard
+from utils.constants import BUTTONS
+from utils.form_utils import get_keyboard_for_question
+
+
+def legacy_keyboard(buttons: Sequence[str]) -> ReplyKeyboardMarkup:
+    builder = ReplyBuilder()
+    builder.add_buttons(buttons)
+    return builder.get_keyboard()
+
+
+def update_buttons(updates: int) -> List[Sequence[str]]:
+    """Наборы кнопок в порядке обновлений при заполнении форм"""
+    cycle = [
+        BUTTONS['start'], BUTTONS['forms'], BUTTONS['form_intro'],
+        get_keyboard_for_question(True, False),
+        *[get_keyboard_for_question(False, False)] * 8,
+        get_keyboard_for_question(False, True),
+        BUTTONS['submit'], BUTTONS['start'],
+    ]
+    return [cycle[i % len(cycle)] for i in range(updates)]
+
+
+def measure(make_keyboard: Callable[[Sequence[str]], ReplyKeyboardMarkup],
+            buttons: List[Sequence[str]]) -> Dict[str, float]:
+    # Прогрев: первое построение клавиатур не считается
+    for keyboard in set(map(tuple, buttons)):
+        make_keyboard(keyboard)
+
+    started = time.perf_counter()
+    for keyboard in buttons:
+        make_keyboard(keyboard)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    # Клавиатуры держатся до конца замера, как в очереди отправки
+    kept = [make_keyboard(keyboard) for keyboard in buttons]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats)
+    retained = sum(stat.size_diff for stat in stats)
+    # Список `kept` (один блок) есть в обоих замерах, его не учитываем
+    list_bytes = kept.__sizeof__()
+    updates = len(buttons)
+    return {
+        'us_per_update': round(elapsed / updates * 1e6, 2),
+        'blocks_per_update': round((blocks - 1) / updates, 2),
+        'bytes_per_update': round((retained - list_bytes) / updates, 1),
+        'distinct_markups': len({id(markup) for markup in kept}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--updates', type=int, default=10000)
+    args = parser.parse_args()
+
+    buttons = update_buttons(args.updates)
+    print(json.dumps({
+        'updates': args.updates,
+        'legacy': measure(legacy_keyboard, buttons),
+        'interned': measure(reply_keyboard, buttons),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Сколько памяти занимают сессии заполнения одной формы.
+
+Запуск:
+    python -m benchmarks.session_state_bench --questions 200 --sessions 500
+
+Сравнивает прежние данные FSM (объект формы и список id вопросов в
+каждой сессии) с компактными (id и версия формы, номер вопроса, ответы).
+Результат — JSON: размер одной сессии в памяти и в сериализованном виде
+и прирост памяти процесса на все сессии по tracemalloc.
+"""
+import argparse
+import copy
+import json
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import synthetic_questions
+from services.models import FormData, Page, Texts
+from utils.form_registry import session_footprint
+from utils.form_utils import compile_form
+
+
+def build_form(questions_count: int) -> FormData:
+    template = synthetic_questions()
+    items = []
+    for number in range(questions_count):
+        item = template[number % len(template)].model_copy()
+        item.id = f'{item.id}_{number}'
+        items.append(item)
+    return FormData(
+        id='bench', name='Анкета', texts=Texts(
+            submit='Отправить', back='Назад', next='Далее'
+        ),
+        pages=[Page(items=items[i:i + 10])
+               for i in range(0, len(items), 10)],
+    )
+
+
+def legacy_session(form: FormData, answers: Dict) -> Dict:
+    # Формы из хранилища приходят отдельными копиями на каждую сессию
+    form = copy.deepcopy(form)
+    compiled = compile_form(form)
+    return {
+        'form_id': form.id,
+        'form_data': form,
+        'answers': dict(answers),
+        'form_navigation': {
+            'current_index': len(answers),
+            'total_questions': compiled.total_questions,
+            'question_ids': list(compiled.question_ids),
+        },
+    }
+
+
+def compact_session(form: FormData, answers: Dict) -> Dict:
+    return {
+        'form_id': form.id,
+        'form_version': compile_form(form).version,
+        'current_index': len(answers),
+        'answers': dict(answers),
+    }
+
+
+def measure(make_session: Callable[[FormData, Dict], Dict],
+            form: FormData, answers: Dict, sessions: int) -> Dict:
+    footprint = session_footprint(make_session(form, answers))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept: List[Dict] = [make_session(form, answers) for _ in range(sessions)]
+    footprint['all_sessions_bytes'] = (
+        tracemalloc.get_traced_memory()[0] - before
+    )
+    tracemalloc.stop()
+    del kept
+    return footprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--answered', type=int, default=20,
+                        help='сколько вопросов уже отвечено в сессии')
+    args = parser.parse_args()
+
+    form = build_form(args.questions)
+    compiled = compile_form(form)
+    answers = {item.id: 'ответ'
+               for item in compiled.questions[:args.answered]}
+
+    print(json.dumps({
+        'questions': args.questions,
+        'sessions': args.sessions,
+        'legacy': measure(legacy_session, form, answers, args.sessions),
+        'compact': measure(compact_session, form, answers, args.sessions),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
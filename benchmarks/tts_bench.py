@@ -0,0 +1,179 @@
+"""
+Замеры задержки и пропускной способности Silero TTS.
+
+Запуск:
+    python -m benchmarks.tts_bench --threads 1 2 4 --speakers xenia baya \\
+        --sample-rates 24000 48000 --concurrency 1 2 4 --out bench.json
+
+Корпус — тексты из `utils/constants.py` и синтетические вопросы
+`format_question_text`. Результат — JSON: перцентили задержки,
+символов в секунду, доля кодирования в Opus, пиковый RSS, а также
+пропускная способность при нескольких одновременных пользователях.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import resource
+import time
+from typing import Dict, List
+
+import torch
+
+from benchmarks.corpus import build_corpus
+from config import config
+from services.silero import silero
+from services.tts import TTSService
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': sum(values) / len(values),
+    }
+
+
+def peak_rss_mb() -> float:
+    # На Linux ru_maxrss в килобайтах, на macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == 'Darwin':
+        rss /= 1024
+    return rss / 1024
+
+
+def model_fingerprint() -> Dict[str, str]:
+    if not silero.model_path:
+        return {'source': 'torch.hub', 'speaker_model': silero.hub_speaker}
+    digest = hashlib.sha256()
+    with open(silero.model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return {'source': silero.model_path, 'sha256': digest.hexdigest()}
+
+
+def bench_sequential(corpus: List[str], speaker: str, sample_rate: int,
+                     repeat: int) -> Dict[str, object]:
+    totals, encodes, chars = [], [], 0
+    for _ in range(repeat):
+        for text in corpus:
+            started = time.perf_counter()
+            audio = silero.synthesize(text=text, speaker=speaker,
+                                      sample_rate=sample_rate)
+            synthesized = time.perf_counter()
+            silero.encode(audio, sample_rate)
+            finished = time.perf_counter()
+            totals.append(finished - started)
+            encodes.append(finished - synthesized)
+            chars += len(text)
+    return {
+        'requests': len(totals),
+        'latency_seconds': latency_summary(totals),
+        'chars_per_second': chars / sum(totals),
+        'encode_share': sum(encodes) / sum(totals),
+    }
+
+
+async def bench_concurrent(corpus: List[str], users: int, threads: int,
+                           executor: str) -> Dict[str, object]:
+    """Каждый из `users` пользователей по очереди озвучивает весь корпус."""
+    service = TTSService(executor=executor, workers=users,
+                         torch_threads=threads)
+    await service.warm_up()
+    latencies: List[float] = []
+
+    async def user(offset: int):
+        for i in range(len(corpus)):
+            # Сдвиг, чтобы пользователи не запрашивали один текст
+            text = corpus[(i + offset) % len(corpus)]
+            started = time.perf_counter()
+            await service.text_to_speech(text)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(offset) for offset in range(users)))
+    elapsed = time.perf_counter() - started
+    await service.shutdown()
+    return {
+        'users': users,
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_seconds': latency_summary(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, nargs='+', default=[4])
+    parser.add_argument('--speakers', nargs='+', default=['xenia'])
+    parser.add_argument('--sample-rates', type=int, nargs='+',
+                        default=[48000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[])
+    parser.add_argument('--executor', choices=['thread', 'process'],
+                        default=config.TTS_EXECUTOR)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='файл для JSON, по умолчанию stdout')
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    silero.load()
+    silero.synthesize(text=corpus[0])
+
+    runs = []
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for speaker in args.speakers:
+            for sample_rate in args.sample_rates:
+                runs.append({
+                    'threads': threads,
+                    'speaker': speaker,
+                    'sample_rate': sample_rate,
+                    **bench_sequential(corpus, speaker, sample_rate,
+                                       args.repeat),
+                })
+
+    concurrent = [
+        asyncio.run(bench_concurrent(corpus, users, threads, args.executor))
+        for threads in args.threads
+        for users in args.concurrency
+    ]
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+        },
+        'model': {
+            **model_fingerprint(),
+            'optimizations': silero.optimizations,
+        },
+        'corpus': {'texts': len(corpus),
+                   'chars': sum(len(text) for text in corpus)},
+        'sequential': runs,
+        'concurrent': concurrent,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Сравнение оптимизированного режима TTS с исходной моделью.
+
+Запуск:
+    python -m benchmarks.tts_compare [--quantize] [--speaker xenia]
+
+Печатает JSON с задержкой синтеза для обоих режимов и сходством
+сигналов (корреляция, SNR, отношение длительностей) по каждому тексту.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import torch
+
+from benchmarks.corpus import build_corpus
+from config import config
+from services.silero import Silero, waveform_similarity
+
+
+def _make_model(optimized: bool, quantize: bool) -> Silero:
+    model = Silero(
+        model_path=config.SILERO_MODEL_PATH,
+        model_sha256=config.SILERO_MODEL_SHA256,
+        allow_download=config.SILERO_ALLOW_DOWNLOAD,
+        optimized=optimized,
+        quantize=quantize,
+    )
+    model.load()
+    return model
+
+
+def _timed(model: Silero, text: str, speaker: str, sample_rate: int):
+    started = time.perf_counter()
+    audio = model.synthesize(text=text, speaker=speaker,
+                             sample_rate=sample_rate)
+    return audio, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--speaker', default='xenia')
+    parser.add_argument('--sample-rate', type=int, default=48000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--quantize', action='store_true')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    baseline = _make_model(optimized=False, quantize=False)
+    optimized = _make_model(optimized=True, quantize=args.quantize)
+
+    corpus = build_corpus()
+    # Прогрев, чтобы первые замеры не включали ленивую инициализацию
+    for model in (baseline, optimized):
+        _timed(model, corpus[0], args.speaker, args.sample_rate)
+
+    rows = []
+    for text in corpus:
+        reference, baseline_time = _timed(
+            baseline, text, args.speaker, args.sample_rate
+        )
+        candidate, optimized_time = _timed(
+            optimized, text, args.speaker, args.sample_rate
+        )
+        rows.append({
+            'chars': len(text),
+            'baseline_seconds': baseline_time,
+            'optimized_seconds': optimized_time,
+            **waveform_similarity(reference, candidate),
+        })
+
+    def summary(key):
+        values = [row[key] for row in rows]
+        return {'mean': statistics.mean(values),
+                'median': statistics.median(values)}
+
+    print(json.dumps({
+        'torch': torch.__version__,
+        'threads': args.threads,
+        'speaker': args.speaker,
+        'sample_rate': args.sample_rate,
+        'optimizations': optimized.optimizations,
+        'baseline_seconds': summary('baseline_seconds'),
+        'optimized_seconds': summary('optimized_seconds'),
+        'speedup': (sum(row['baseline_seconds'] for row in rows)
+                    / sum(row['optimized_seconds'] for row in rows)),
+        'correlation': summary('correlation'),
+        'length_ratio': summary('length_ratio'),
+        'texts': rows,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
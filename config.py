@@ -1,3 +1,5 @@
+from typing import Dict, Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -22,5 +24,101 @@ class Settings(BaseSettings):
     YAFORMS_BASE_URL: str
     TEST_FORM_ID: str
 
+    # HTTP-клиент Яндекс Форм: общий пул соединений
+    FORMS_HTTP_LIMIT: int = 100
+    FORMS_HTTP_LIMIT_PER_HOST: int = 0
+    FORMS_HTTP_KEEPALIVE: float = 30
+    FORMS_HTTP_DNS_TTL: int = 300
+    FORMS_HTTP_TIMEOUT: float = 30
+    # Сколько секунд структура формы считается свежей без перепроверки
+    FORMS_SCHEMA_TTL: float = 60
+    # Выгрузка отчета: предельное время и срок хранения готового файла
+    FORMS_EXPORT_DEADLINE: float = 300
+    FORMS_EXPORT_RESULT_TTL: float = 60
+    # Лимит запросов к API форм (в секунду, 0 — без лимита), размер
+    # всплеска, отдельные лимиты эндпоинтов (submit, form, export)
+    # и число повторов после ответа 429
+    FORMS_RATE_LIMIT: float = 10
+    FORMS_RATE_BURST: float = 20
+    FORMS_ENDPOINT_RATE_LIMITS: Dict[str, float] = {}
+    FORMS_RATE_LIMIT_RETRIES: int = 3
+
+    # Очередь отправки ответов: файл SQLite, воркеры и число попыток
+    OUTBOX_DB: str = '.cache/outbox.sqlite3'
+    OUTBOX_WORKERS: int = 2
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    # Через сколько секунд запись упавшего процесса отправляется повторно
+    OUTBOX_LEASE_SECONDS: float = 300
+
+    # Синтез речи: пул воркеров ('thread' или 'process').
+    # 0 — подобрать значение по количеству ядер.
+    TTS_EXECUTOR: Literal['thread', 'process'] = 'thread'
+    TTS_WORKERS: int = 0
+    TTS_TORCH_THREADS: int = 0
+    # Окно сбора одновременных запросов синтеза в пакет
+    TTS_BATCH_SIZE: int = 16
+    TTS_BATCH_WAIT_MS: int = 10
+    # Длинные тексты озвучиваются частями не длиннее этого числа символов
+    TTS_CHUNK_CHARS: int = 500
+
+    # Локальный файл модели Silero TTS (например, v3_1_ru.pt) и его
+    # sha256. Без файла модель скачивается через torch.hub, если разрешено.
+    SILERO_MODEL_PATH: str = ''
+    SILERO_MODEL_SHA256: str = ''
+    SILERO_ALLOW_DOWNLOAD: bool = True
+    # Оптимизированный режим инференса на CPU и int8 квантование
+    TTS_OPTIMIZED: bool = False
+    TTS_QUANTIZE: bool = False
+
+    # Распознавание голосовых ответов: локальная модель Silero STT
+    # (TorchScript) для русского языка. Пустой путь выключает распознавание.
+    STT_MODEL_PATH: str = ''
+    STT_BATCH_SIZE: int = 8
+    STT_BATCH_WAIT_MS: int = 50
+
+    # Кэш синтезированного аудио: LRU в памяти перед каталогом на диске.
+    AUDIO_CACHE_DIR: str = '.cache/audio'
+    AUDIO_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024
+    AUDIO_CACHE_DISK_BYTES: int = 1024 * 1024 * 1024
+
+    # file_id уже загруженных в Telegram голосовых сообщений.
+    VOICE_FILE_IDS_DB: str = '.cache/voice_file_ids.sqlite3'
+
+    # Хранилище сессий FSM: memory, sqlite или redis. Изменения пишутся
+    # пачками раз в FSM_FLUSH_INTERVAL секунд; FSM_STATE_TTL (Redis,
+    # секунды, 0 — бессрочно) удаляет брошенные сессии
+    FSM_STORAGE: Literal['memory', 'sqlite', 'redis'] = 'memory'
+    FSM_SQLITE_PATH: str = '.cache/fsm.sqlite3'
+    FSM_REDIS_URL: str = 'redis://localhost:6379/0'
+    FSM_FLUSH_INTERVAL: float = 0.2
+    FSM_FLUSH_BATCH: int = 256
+    FSM_STATE_TTL: int = 0
+
+    # Прием обновлений: polling или webhook. Для вебхука нужен публичный
+    # адрес WEBHOOK_BASE_URL; секрет по умолчанию выводится из токена
+    BOT_MODE: Literal['polling', 'webhook'] = 'polling'
+    WEBHOOK_BASE_URL: str = ''
+    WEBHOOK_PATH: str = '/webhook'
+    WEBHOOK_SECRET: str = ''
+    WEBHOOK_HOST: str = '0.0.0.0'
+    WEBHOOK_PORT: int = 8080
+    # Сколько обновлений обрабатывается одновременно и сколько
+    # соединений может открыть Telegram
+    WEBHOOK_MAX_CONCURRENCY: int = 64
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+
+    # Воркеры launcher.py (0 — по числу ядер) и общий каталог версий
+    # форм, которые заполняют пользователи
+    BOT_WORKERS: int = 0
+    FORM_REGISTRY_DIR: str = '.cache/forms'
+
+    # Метрики Prometheus (/metrics) и проверка готовности (/ready) на
+    # локальном порту, 0 — без сервера. Воркеры launcher.py занимают
+    # следующие порты: METRICS_PORT + 1 + номер воркера
+    METRICS_HOST: str = '127.0.0.1'
+    METRICS_PORT: int = 9100
+    # Как часто замерять задержку цикла событий, секунды (0 — не замерять)
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5
+
 
 config = Settings()
@@ -1,32 +1,47 @@
+import logging
+import secrets
+from typing import Dict, Optional
+
 from aiogram import F, Router
-from aiogram.types import Message
-from aiogram.filters import CommandStart, CommandObject
+from aiogram.types import BufferedInputFile, Message
+from aiogram.filters import Command, CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
 
-from keyboard.reply_kb import MainKb
-from utils.handlers_util import send_voice_message, get_form_id
+from keyboard.reply_kb import reply_keyboard
+from utils.handlers_util import (send_voice_message, get_form_id,
+                                 run_in_background)
 from utils.constants import (INSTRUCTION_TEXT, HELP_TEXT, PRIVACY_TEXT,
                              FORM_EXAMPLE, PLEASE_COMPLETE,
-                             REQUIRED_FIELD, BUTTONS, COMPANY,
-                             OK, NOT_OK, BEGIN, QUESTION_OK,
-                             SAY_NO, SAY_YES, OUTPUT)
+                             BUTTONS, COMPANY, FORM_CHANGED,
+                             NOT_OK, BEGIN, QUESTION_OK,
+                             OUTPUT, TTS_STATUS,
+                             VOICE_ANSWER, SUBMISSION_QUEUED,
+                             SUBMISSION_DUPLICATE)
+from services.exports import export_jobs
 from services.forms import ya_forms
-from services.models import FormItem
-from utils.form_utils import (FormNavigation,
-                              format_question_text,
-                              format_confirmation_message,
+from services.metrics import HandlerMetricsMiddleware, SessionTracker, metrics
+from services.outbox import outbox
+from services.stt import stt
+from services.tts import tts
+from utils.form_registry import form_registry
+from utils.form_utils import (CompiledForm, format_confirmation_message,
                               get_keyboard_for_question,
-                              get_intro_form_header,
-                              is_required)
+                              get_intro_form_header)
 from states.states import FormFilling
 
 # from pprint import pprint
-from datetime import datetime
-import re
 
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
+# Время работы обработчиков и число сессий в каждом состоянии анкеты
+sessions = SessionTracker(FormFilling.__all_states_names__)
+metrics.gauge('bot_form_sessions', 'Сессии заполнения формы по состояниям',
+              ('state',), function=sessions.collect)
+router.message.middleware(HandlerMetricsMiddleware(sessions))
+
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, command: CommandObject):
@@ -38,6 +53,11 @@ async def cmd_start(message: Message, command: CommandObject):
                              'help.wav', BUTTONS['start'])
 
 
+@router.message(Command('status'))
+async def status_handler(message: Message):
+    await message.answer(TTS_STATUS[tts.state])
+
+
 @router.message(FormFilling.waiting_for_answers, F.text == 'Назад')
 async def handle_change_answer_button(message: Message, state: FSMContext):
     await change_previous_answer(message, state)
@@ -64,12 +84,19 @@ async def privacy_handler(message: Message):
 async def get_url_handler(message: Message, state: FSMContext):
     me = await message.bot.get_me()
     form_id = get_form_id(message.text)
+    # Оператор присылает ссылку, в том числе после правки формы,
+    # поэтому закэшированная структура больше не считается актуальной
+    ya_forms.invalidate_form(form_id)
 
+    # Незаконченная анкета по прежней форме больше не продолжается
+    data = await state.get_data()
+    form_registry.release(data.get('form_id'), data.get('form_version'))
+    await state.clear()
     await state.update_data(form_id=form_id)
 
     await message.answer(
         f'Ваша ссылка: https://t.me/{me.username}?start={form_id}',
-        reply_markup=MainKb(BUTTONS['forms']).get_keyboard()
+        reply_markup=reply_keyboard(BUTTONS['forms'])
     )
 
 
@@ -82,72 +109,77 @@ async def create_form_handler(message: Message):
 async def get_form_handler(message: Message, state: FSMContext):
     data = await state.get_data()
     form_id = data.get('form_id')
-    form_data = await ya_forms.get_form_data(str(form_id))
-    form_nav = FormNavigation(form_data)
+    compiled = await form_registry.load(str(form_id))
 
     response_text = get_intro_form_header(
-        title=form_data.name,
+        title=compiled.form.name,
         company=COMPANY,
-        questions_count=form_nav.get_total_questions()
+        # Вопросы, скрытые условиями до первого ответа, не считаем
+        questions_count=compiled.visible_total(compiled.initial_hidden())
     )
-
-    question_number = 1
-    for page in form_data.pages:
-        for item in page.items:
-            if not item.hidden:
-                response_text += f'{question_number}. {item.label}'
-                if item.validations and is_required(item.validations):
-                    response_text += REQUIRED_FIELD
-                response_text += '\n'
-                if item.comment:
-                    response_text += f'<i>{item.comment}</i>\n'
-                response_text += '\n'
-                question_number += 1
+    response_text += compiled.overview
     response_text += PLEASE_COMPLETE
-    await state.update_data(form_data=form_data)
+    # В сессии храним только ссылку на версию формы из общего реестра
+    form_registry.release(form_id, data.get('form_version'))
+    await form_registry.acquire(compiled)
+    await state.update_data(form_version=compiled.version)
 
     await send_voice_message(
         message, response_text,
-        f'{form_data.name}.wav',
+        f'{compiled.form.name}.wav',
         BUTTONS['form_intro']
     )
 
 
+async def session_form(message: Message, state: FSMContext,
+                       data: Dict) -> Optional[CompiledForm]:
+    """
+    Форма, которую заполняет пользователь. Если ее версии больше нет,
+    анкета начинается заново с актуальной версией формы.
+    """
+    compiled = await form_registry.for_session(data)
+    if compiled is not None:
+        return compiled
+    if not data.get('form_version'):
+        await message.answer(OUTPUT['OPEN'])
+        return None
+
+    # Индексы и ответы сессии относятся к прежнему списку вопросов
+    await state.clear()
+    await state.update_data(form_id=data.get('form_id'))
+    await message.answer(FORM_CHANGED)
+    await get_form_handler(message, state)
+    return None
+
+
 @router.message(F.text == 'Заполнить форму')
 async def start_form_filling(message: Message, state: FSMContext):
     # Получаем данные формы
     data = await state.get_data()
-    form_data = data.get('form_data')
-
-    # Инициализируем навигацию по форме
-    form_nav = FormNavigation(form_data)
-    current_question = form_nav.get_current_question()
-
-    page_idx, item_idx, question_item = current_question
-
-    # Инициализируем словарь для ответов
-    await state.update_data(
-        answers={},
-        form_navigation={
-            'current_index': 0,
-            'total_questions': form_nav.get_total_questions(),
-            'question_ids': [q[2].id for q in form_nav.visible_questions]
-        }
-    )
+    compiled = await session_form(message, state, data)
+    if compiled is None:
+        return
+
+    # Инициализируем навигацию и словарь для ответов
+    hidden = compiled.initial_hidden()
+    first_index = compiled.next_index(-1, hidden)
+    if first_index is None:
+        await message.answer("Ошибка: вопрос не найден")
+        return
+    await state.update_data(answers={}, current_index=first_index,
+                            hidden=hidden)
 
     await state.set_state(FormFilling.waiting_for_answers)
 
-    question_text = format_question_text(
-        question_item,
-        1,
-        form_nav.get_total_questions()
-    )
+    question_segments = compiled.question_segments(first_index, hidden)
+    question_text = ''.join(question_segments)
 
     keyboard = get_keyboard_for_question(is_first=True, is_last=False)
 
     await send_voice_message(
         message, BEGIN + question_text,
-        'begin.wav', keyboard
+        'begin.wav', keyboard,
+        segments=[BEGIN, *question_segments]
     )
 
     # await message.answer(
@@ -158,73 +190,84 @@ async def start_form_filling(message: Message, state: FSMContext):
 
 @router.message(FormFilling.waiting_for_answers, F.text)
 async def process_answer(message: Message, state: FSMContext):
+    await handle_user_answer(message, state, message.text)
+
+
+@router.message(FormFilling.waiting_for_answers, F.voice)
+async def process_voice_answer(message: Message, state: FSMContext):
+    """Принимает ответ голосом: распознает и обрабатывает как текст"""
+    if not stt.enabled:
+        await message.answer(VOICE_ANSWER['DISABLED'])
+        return
+
+    try:
+        voice_file = await message.bot.download(message.voice)
+        recognized = await stt.recognize(voice_file.read())
+    except Exception:
+        # Модель не загрузилась или распознавание упало
+        logger.exception('Ошибка распознавания голосового ответа')
+        recognized = None
+    if not recognized:
+        await message.answer(VOICE_ANSWER['EMPTY'])
+        return
+
+    await message.answer(VOICE_ANSWER['RECOGNIZED'] + recognized)
+    await handle_user_answer(message, state, recognized)
+
+
+async def handle_user_answer(message: Message, state: FSMContext,
+                             user_input: str):
+    """Проверяет ответ на текущий вопрос и переходит к следующему"""
     data = await state.get_data()
-    form_data = data.get('form_data')
     answers = data.get('answers', {})
-    nav_data = data.get('form_navigation', {})
-
-    current_index = nav_data.get('current_index', 0)
-    total_questions = nav_data.get('total_questions', 0)
-    question_ids = nav_data.get('question_ids', [])
+    current_index = data.get('current_index', 0)
+    hidden = data.get('hidden', [])
 
     # Получаем текущий вопрос
-    current_question_id = question_ids[current_index]
-    current_question = None
-    for page in form_data.pages:
-        for item in page.items:
-            if item.id == current_question_id:
-                current_question = item
-                break
-        if current_question:
-            break
-
-    if not current_question:
+    compiled = await session_form(message, state, data)
+    if compiled is None:
+        return
+    if current_index >= compiled.total_questions:
         await message.answer("Ошибка: вопрос не найден")
         return
+    current_question = compiled.questions[current_index]
+    current_question_id = current_question.id
 
     # Обрабатываем ответ
-    processed_answer = await process_user_answer(message.text,
-                                                 current_question)
-    if processed_answer is None:
+    parser = compiled.parsers[current_index]
+    result = parser.parse(user_input)
+    if not result.ok:
         # Ответ невалидный, остаемся на том же вопросе
+        await message.answer(parser.rejection_text(result))
         return
+    processed_answer = result.value
 
-    # Сохраняем ответ
+    # Сохраняем ответ и пересчитываем вопросы, которые от него зависят
     answers[current_question_id] = processed_answer
+    hidden = compiled.conditions.update(hidden, answers,
+                                        current_question_id)
+    answers = compiled.visible_answers(answers, hidden)
 
     # Переходим к следующему вопросу или завершаем
-    next_index = current_index + 1
-    await state.update_data(answers=answers)
+    next_index = compiled.next_index(current_index, hidden)
+    await state.update_data(answers=answers, hidden=hidden)
 
-    if next_index < total_questions:
+    if next_index is not None:
         # Показываем следующий вопрос
-        nav_data['current_index'] = next_index
-        await state.update_data(form_navigation=nav_data)
-
-        next_question_id = question_ids[next_index]
-        next_question = None
-        for page in form_data.pages:
-            for item in page.items:
-                if item.id == next_question_id:
-                    next_question = item
-                    break
-            if next_question:
-                break
-
-        question_text = format_question_text(
-            next_question,
-            next_index + 1,
-            total_questions
-        )
+        await state.update_data(current_index=next_index)
+
+        question_segments = compiled.question_segments(next_index, hidden)
+        question_text = ''.join(question_segments)
 
-        is_last = next_index == total_questions - 1
+        is_last = compiled.next_index(next_index, hidden) is None
         keyboard = get_keyboard_for_question(False, is_last)
 
 
         await send_voice_message(
             message, QUESTION_OK + question_text,
             f'{current_index}.wav',
-            keyboard
+            keyboard,
+            segments=[QUESTION_OK, *question_segments]
         )
 
         # await message.answer(
@@ -233,11 +276,13 @@ async def process_answer(message: Message, state: FSMContext):
         # )
 
     else:
-        # Все вопросы пройдены, показываем подтверждение
+        # Все вопросы пройдены, показываем подтверждение.
+        # id отправки защищает от двойного нажатия "Отправить"
         await state.set_state(FormFilling.confirmation)
+        await state.update_data(submission_id=secrets.token_hex(16))
 
         confirmation_text = await format_confirmation_message(
-            form_data, answers
+            compiled.form, answers, hidden
         )
 
         await send_voice_message(
@@ -251,139 +296,28 @@ async def process_answer(message: Message, state: FSMContext):
         # )
 
 
-async def process_user_answer(user_input: str, question: FormItem):
-    """Обрабатывает и валидирует ответ пользователя"""
-
-    # Вопрос с выбором варианта (enum)
-    if question.type == 'enum' and question.items:
-        return await _process_enum_answer(user_input, question)
-
-    # Булевый вопрос (флажок)
-    elif question.type == 'boolean':
-        return await _process_boolean_answer(user_input, question)
-
-    elif question.type == 'date':
-        return await _process_date_answer(user_input, question)
-
-    # Текстовый вопрос
-    elif question.type == 'string':
-        return user_input.strip()
-
-    # Для других типов вопросов можно добавить обработку
-    return user_input
-
-
-async def _process_date_answer(user_input: str, question: FormItem):
-    """Обрабатывает ответ на вопрос с датой"""
-    try:
-        # Пробуем разные форматы дат
-        date_formats = [
-            '%d.%m.%Y',  # 01.01.2023
-            '%d/%m/%Y',  # 01/01/2023
-            '%d-%m-%Y',  # 01-01-2023
-            '%Y-%m-%d',  # 2023-01-01 (ISO format)
-        ]
-
-        user_input = user_input.strip()
-
-        for date_format in date_formats:
-            try:
-                parsed_date = datetime.strptime(user_input, date_format)
-                return parsed_date.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
-
-        return None
-
-    except Exception:
-        return None
-
-
-
-async def _process_enum_answer(user_input: str, question: FormItem):
-    """Обрабатывает ответ на вопрос с выбором варианта"""
-    try:
-        # Для radio-кнопок (одиночный выбор)
-        if question.widget == 'radio':
-            choice_index = int(user_input) - 1
-            if 0 <= choice_index < len(question.items):
-                return [question.items[choice_index].id]
-            else:
-                return None
-
-        # Для checkbox (множественный выбор) или по умолчанию
-        else:
-            # Разделяем ввод по пробелам, запятым или другим разделителям
-            choices = re.findall(r'\d+', user_input)
-            selected_ids = []
-
-            for choice_str in choices:
-                choice_index = int(choice_str) - 1
-                if 0 <= choice_index < len(question.items):
-                    selected_ids.append(question.items[choice_index].id)
-
-            # Если выбраны варианты, возвращаем их
-            if selected_ids:
-                return selected_ids
-            else:
-                return None
-
-    except ValueError:
-        return None
-
-
-async def _process_boolean_answer(user_input: str, question: FormItem):
-    """Обрабатывает ответ на булевый вопрос (флажок)"""
-    user_input_lower = user_input.lower().strip()
-    if user_input_lower in SAY_YES:
-        return True
-    elif user_input_lower in SAY_NO:
-        return False
-    else:
-        # Если ввод не распознан, пытаемся интерпретировать как число
-        try:
-            return bool(int(user_input))
-        except ValueError:
-            return None
-
-
 @router.message(FormFilling.waiting_for_answers, F.text == 'Назад')
 async def change_previous_answer(message: Message, state: FSMContext):
     data = await state.get_data()
-    nav_data = data.get('form_navigation', {})
-
-    current_index = nav_data.get('current_index', 0)
-    total_questions = nav_data.get('total_questions', 0)
-    question_ids = nav_data.get('question_ids', [])
-
-    if current_index > 0:
-        nav_data['current_index'] = current_index - 1
-        await state.update_data(form_navigation=nav_data)
-
-        form_data = data.get('form_data')
-        prev_question_id = question_ids[current_index - 1]
-        prev_question = None
-
-        for page in form_data.pages:
-            for item in page.items:
-                if item.id == prev_question_id:
-                    prev_question = item
-                    break
-            if prev_question:
-                break
-
-        question_text = format_question_text(
-            prev_question,
-            current_index,  # Текущий индекс теперь предыдущий
-            total_questions
-        )
+    current_index = data.get('current_index', 0)
+    hidden = data.get('hidden', [])
+    compiled = await session_form(message, state, data)
+    if compiled is None:
+        return
+    previous_index = compiled.previous_index(current_index, hidden)
+
+    if previous_index is not None:
+        await state.update_data(current_index=previous_index)
 
-        is_last = current_index - 1 == total_questions - 1
-        keyboard = get_keyboard_for_question(current_index - 1 == 0, is_last)
+        question_text = compiled.question_text(previous_index, hidden)
+
+        is_first = compiled.previous_index(previous_index, hidden) is None
+        is_last = compiled.next_index(previous_index, hidden) is None
+        keyboard = get_keyboard_for_question(is_first, is_last)
 
         await message.answer(
             text=f"↩️ Возвращаемся к предыдущему вопросу:\n\n{question_text}",
-            reply_markup=MainKb(keyboard).get_keyboard()
+            reply_markup=reply_keyboard(keyboard)
         )
     else:
         await message.answer("Это первый вопрос, нельзя вернуться назад")
@@ -392,119 +326,115 @@ async def change_previous_answer(message: Message, state: FSMContext):
 @router.message(FormFilling.waiting_for_answers, F.text == 'Показать все ответы')
 async def show_all_answers_preview(message: Message, state: FSMContext):
     data = await state.get_data()
-    form_data = data.get('form_data')
+    compiled = await session_form(message, state, data)
+    if compiled is None:
+        return
     answers = data.get('answers', {})
 
-    confirmation_text = await format_confirmation_message(form_data, answers)
+    confirmation_text = await format_confirmation_message(
+        compiled.form, answers, data.get('hidden', [])
+    )
 
     await message.answer(
         text=confirmation_text,
-        reply_markup=MainKb(['Продолжить заполнение', 'Начать заново']).get_keyboard()
+        reply_markup=reply_keyboard(('Продолжить заполнение', 'Начать заново'))
     )
 
 
 @router.message(FormFilling.waiting_for_answers, F.text == 'Продолжить заполнение')
 async def continue_filling(message: Message, state: FSMContext):
     data = await state.get_data()
-    nav_data = data.get('form_navigation', {})
-    form_data = data.get('form_data')
-
-    current_index = nav_data.get('current_index', 0)
-    total_questions = nav_data.get('total_questions', 0)
-    question_ids = nav_data.get('question_ids', [])
-
-    current_question_id = question_ids[current_index]
-    current_question = None
-
-    for page in form_data.pages:
-        for item in page.items:
-            if item.id == current_question_id:
-                current_question = item
-                break
-        if current_question:
-            break
-
-    question_text = format_question_text(
-        current_question,
-        current_index + 1,
-        total_questions
-    )
+    compiled = await session_form(message, state, data)
+    if compiled is None:
+        return
+
+    current_index = data.get('current_index', 0)
+    hidden = data.get('hidden', [])
 
-    is_last = current_index == total_questions - 1
+    question_text = compiled.question_text(current_index, hidden)
+
+    is_last = compiled.next_index(current_index, hidden) is None
     keyboard = get_keyboard_for_question(False, is_last)
 
     await message.answer(
         text=f"Продолжаем заполнение:\n\n{question_text}",
-        reply_markup=MainKb(keyboard).get_keyboard()
+        reply_markup=reply_keyboard(keyboard)
     )
 
 
 @router.message(FormFilling.confirmation, F.text == 'Отправить')
 async def send_results(message: Message, state: FSMContext):
     data = await state.get_data()
+    # Ответы отправляются только для той версии формы, на которую даны
+    if await session_form(message, state, data) is None:
+        return
     answers = data.get('answers', {})
     form_id = data.get('form_id')
+    # Сессии, начатые до появления id отправки, получают его здесь
+    submission_id = data.get('submission_id') or secrets.token_hex(16)
 
     try:
-        # Отправляем ответы в Яндекс Формы
-        success = await ya_forms.fill_the_form(str(form_id),
-                                               answers)
-
-        if success:
-            await send_voice_message(
-                message, OK,
-                'OK.wav', BUTTONS['start']
-            )
+        # Сохраняем ответы в очередь: в Яндекс Формы их отправит
+        # фоновый воркер и сообщит пользователю о результате
+        created = await outbox.enqueue(message.chat.id, str(form_id),
+                                       answers, submission_id)
 
     except Exception as e:
-            await send_voice_message(
-                message, NOT_OK + str(e),
-                'NOT_OK.wav', BUTTONS['start']
-            )
+        # Ответы не сохранены, оставляем их, чтобы можно было повторить
+        await send_voice_message(
+            message, NOT_OK + str(e),
+            'NOT_OK.wav', BUTTONS['submit']
+        )
+        return
 
-    finally:
-        await state.clear()
+    form_registry.release(form_id, data.get('form_version'))
+    await state.clear()
+    if not created:
+        # Эти ответы уже в очереди: второе нажатие ничего не отправляет
+        await send_voice_message(
+            message, SUBMISSION_DUPLICATE,
+            'duplicate.wav', BUTTONS['start']
+        )
+        return
+    await send_voice_message(
+        message, SUBMISSION_QUEUED,
+        'queued.wav', BUTTONS['start']
+    )
 
 
 @router.message(FormFilling.confirmation, F.text == 'Начать заново')
 async def restart_form(message: Message, state: FSMContext):
+    data = await state.get_data()
+    compiled = await session_form(message, state, data)
+    if compiled is None:
+        return
+
     # Очищаем ответы и начинаем заново
     await state.update_data(answers={})
 
-    data = await state.get_data()
-    form_data = data.get('form_data')
-
     # Сбрасываем навигацию
-    form_nav = FormNavigation(form_data)
-    current_question = form_nav.get_current_question()
-
-    page_idx, item_idx, question_item = current_question
-
-    await state.update_data(
-        form_navigation={
-            'current_index': 0,
-            'total_questions': form_nav.get_total_questions(),
-            'question_ids': [q[2].id for q in form_nav.visible_questions]
-        }
-    )
+    hidden = compiled.initial_hidden()
+    first_index = compiled.next_index(-1, hidden)
+    await state.update_data(current_index=first_index, hidden=hidden)
 
     await state.set_state(FormFilling.waiting_for_answers)
 
-    question_text = format_question_text(
-        question_item,
-        1,
-        form_nav.get_total_questions()
-    )
+    question_text = compiled.question_text(first_index, hidden)
 
     await message.answer(
         text=f"🔄 Начинаем заполнение формы заново!\n\n{question_text}",
-        reply_markup=MainKb(['Заполнить форму']).get_keyboard()
+        reply_markup=reply_keyboard(('Заполнить форму',))
     )
 
 
 @router.message(F.text == 'Отчет')
 async def export_report_handler(message: Message, state: FSMContext):
-    """Обработчик для выгрузки отчета"""
+    """
+    Обработчик для выгрузки отчета.
+
+    Выгрузка идет в фоне: обработчик сразу освобождается, а готовый
+    файл приходит отдельным сообщением.
+    """
     data = await state.get_data()
     form_id = data.get('form_id')
 
@@ -512,23 +442,29 @@ async def export_report_handler(message: Message, state: FSMContext):
         await message.answer(OUTPUT['OPEN'])
         return
 
-    try:
-        # Показываем сообщение о начале выгрузки
-        wait_msg = await message.answer(OUTPUT['WAIT'])
+    # Показываем сообщение о начале выгрузки
+    wait_msg = await message.answer(OUTPUT['WAIT'])
+
+    # Получаем название формы для имени файла
+    compiled = await form_registry.for_session(data)
+    form_name = compiled.form.name if compiled else 'report'
 
+    run_in_background(
+        deliver_report(message, wait_msg, str(form_id), form_name)
+    )
+
+
+async def deliver_report(message: Message, wait_msg: Message,
+                         form_id: str, form_name: str):
+    """Дожидается выгрузки и отправляет файл запросившему"""
+    try:
         # Выгружаем результаты в формате xlsx
-        report_data = await ya_forms.export_results(
-            survey_id=str(form_id),
+        report_data = await export_jobs.export(
+            survey_id=form_id,
             format='xlsx'
         )
 
         if report_data:
-            # Создаем файл для отправки
-            from aiogram.types import BufferedInputFile
-
-            # Получаем название формы для имени файла
-            form_data = data.get('form_data')
-            form_name = form_data.name if form_data else 'report'
             filename = f"{form_name}_отчет.xlsx"
 
             # Создаем объект файла
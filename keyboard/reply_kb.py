@@ -1,8 +1,12 @@
+from functools import lru_cache
+from typing import Iterable, Tuple
+
 from aiogram.utils.keyboard import (
     ReplyKeyboardBuilder,
     KeyboardButton,
     ReplyKeyboardMarkup
 )
+from pydantic import ConfigDict
 
 
 class ReplyBuilder:
@@ -22,7 +26,37 @@ class ReplyBuilder:
             one_time_keyboard=is_one_time
         )
 
-class MainKb(ReplyBuilder):
+
+class SharedReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    """Клавиатура, общая для всех сообщений: поля менять нельзя"""
+    model_config = ConfigDict(frozen=True)
+
+
+@lru_cache(maxsize=256)
+def _interned_keyboard(buttons: Tuple[str, ...], row: int,
+                       is_one_time: bool) -> SharedReplyKeyboardMarkup:
+    builder = ReplyBuilder()
+    builder.add_buttons(buttons)
+    markup = builder.get_keyboard(row, is_one_time)
+    return SharedReplyKeyboardMarkup.model_validate(markup.model_dump())
+
+
+def reply_keyboard(buttons: Iterable[str], row: int = 1,
+                   is_one_time: bool = True) -> ReplyKeyboardMarkup:
+    """
+    Клавиатура с кнопками `buttons`.
+
+    Наборов кнопок в боте немного, поэтому клавиатура строится один раз
+    на набор и раскладку, а дальше возвращается тот же объект.
+    """
+    if not isinstance(buttons, tuple):
+        buttons = tuple(buttons)
+    return _interned_keyboard(buttons, row, is_one_time)
+
+
+class MainKb:
     def __init__(self, spec_buttons):
-        super().__init__()
-        self.add_buttons(spec_buttons)
+        self.buttons = tuple(spec_buttons)
+
+    def get_keyboard(self, row: int = 1, is_one_time: bool = True) -> ReplyKeyboardMarkup:
+        return reply_keyboard(self.buttons, row, is_one_time)
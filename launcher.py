@@ -0,0 +1,329 @@
+"""
+Запуск бота в нескольких процессах.
+
+    python launcher.py --workers 4
+
+Главный процесс принимает обновления (long polling или вебхук, по
+`BOT_MODE`) и раздает их воркерам по id чата: все обновления одного
+чата попадают в один воркер, поэтому его сессия FSM и порядок
+сообщений сохраняются. Каждый воркер — отдельный процесс со своим
+диспетчером и моделью Silero, поэтому синтез речи занимает все ядра.
+Ядра делятся между воркерами поровну, если `TTS_WORKERS` и
+`TTS_TORCH_THREADS` не заданы явно.
+
+Воркеры делят дисковый кэш аудио, `file_id` голосовых сообщений,
+очередь отправки ответов и сохраненные версии форм (`FORM_REGISTRY_DIR`).
+Чтобы незаконченные анкеты переживали перезапуск воркера, нужно
+постоянное хранилище FSM (`FSM_STORAGE=sqlite` или `redis`).
+
+Упавший воркер перезапускается с паузой, растущей при частых падениях;
+обновления его чатов ждут в очереди.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiohttp import web
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+# Обновления, в которых чат указан в поле `chat` вложенного объекта
+CHAT_UPDATES = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'business_message', 'edited_business_message', 'message_reaction',
+    'message_reaction_count', 'chat_boost', 'removed_chat_boost',
+    'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """id чата (или пользователя), к которому относится обновление"""
+    for kind in CHAT_UPDATES:
+        event = update.get(kind)
+        if event and 'chat' in event:
+            return event['chat']['id']
+    callback = update.get('callback_query')
+    if callback and callback.get('message'):
+        return callback['message']['chat']['id']
+    for event in update.values():
+        if isinstance(event, dict):
+            user = event.get('from') or event.get('user')
+            if user:
+                return user['id']
+    return update.get('update_id', 0)
+
+
+def shard_for(update: Dict[str, Any], workers: int) -> int:
+    return update_chat_id(update) % workers
+
+
+def share_tts_cores(workers: int) -> None:
+    """
+    Отдает синтезу речи в воркере его долю ядер. Без этого пул
+    синтеза каждого воркера рассчитан на все ядра машины, и воркеры
+    мешают друг другу. Вызывается до импорта `services.tts`.
+    """
+    cores = max(1, (os.cpu_count() or 1) // workers)
+    if config.TTS_EXECUTOR == 'process':
+        config.TTS_WORKERS = config.TTS_WORKERS or max(1, cores // 2)
+        config.TTS_TORCH_THREADS = (config.TTS_TORCH_THREADS
+                                    or max(1, cores // config.TTS_WORKERS))
+    else:
+        # Потоки torch общие для всех потоков пула
+        config.TTS_TORCH_THREADS = config.TTS_TORCH_THREADS or cores
+
+
+def worker_main(index: int, workers: int, updates: multiprocessing.Queue,
+                max_concurrency: int) -> None:
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(level=logging.INFO,
+                        format=f'[worker {index}] %(levelname)s %(message)s')
+    share_tts_cores(workers)
+    try:
+        asyncio.run(run_worker(index, updates, max_concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_worker(index: int, updates: multiprocessing.Queue,
+                     max_concurrency: int) -> None:
+    from main import create_bot, create_dispatcher
+    from services.metrics import metrics_server
+
+    # У каждого воркера свой порт метрик
+    if metrics_server.port:
+        metrics_server.port = config.METRICS_PORT + 1 + index
+
+    bot = create_bot()
+    # Обновления одного чата обрабатываются по очереди
+    dp = create_dispatcher(bot, isolate_events=True)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_concurrency)
+    tasks = set()
+
+    async def feed(update: Dict[str, Any]) -> None:
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception:
+            logger.exception('Ошибка обработки обновления')
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            update = await loop.run_in_executor(None, updates.get)
+            if update is None:
+                break
+            await slots.acquire()
+            task = asyncio.create_task(feed(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+class Supervisor:
+    """Запускает воркеры и перезапускает упавшие"""
+    def __init__(self, workers: int, max_concurrency: int,
+                 min_restart_delay: float = 1,
+                 max_restart_delay: float = 30):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.min_restart_delay = min_restart_delay
+        self.max_restart_delay = max_restart_delay
+        # spawn: воркеры не наследуют потоки и состояние torch родителя
+        self.context = multiprocessing.get_context('spawn')
+        self.queues: List[multiprocessing.Queue] = [
+            self.context.Queue() for _ in range(workers)
+        ]
+        self.processes: List[Optional[multiprocessing.Process]] = \
+            [None] * workers
+        self.restart_delays = [min_restart_delay] * workers
+        self.started_at = [0.0] * workers
+        self.restarts = [0] * workers
+        # Asyncio хранит на задачи только слабые ссылки
+        self._restarting: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def _start(self, index: int) -> None:
+        # Не демон: демоническому процессу нельзя запускать дочерние,
+        # а синтез речи в режиме TTS_EXECUTOR=process их запускает.
+        # Воркеры останавливает `stop()`
+        process = self.context.Process(
+            target=worker_main, name=f'bot-worker-{index}',
+            args=(index, self.workers, self.queues[index],
+                  self.max_concurrency),
+            daemon=False,
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        logger.info('Воркер %d запущен (pid %s)', index, process.pid)
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self._start(index)
+
+    def dispatch(self, update: Dict[str, Any]) -> None:
+        self.queues[shard_for(update, self.workers)].put(update)
+
+    def alive(self) -> List[bool]:
+        return [bool(p and p.is_alive()) for p in self.processes]
+
+    async def watch(self, interval: float = 1) -> None:
+        """Следит за воркерами и перезапускает упавшие с паузой"""
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is None or process.is_alive() or self._stopping:
+                    continue
+                logger.error('Воркер %d завершился с кодом %s',
+                             index, process.exitcode)
+                # Долго проработавший воркер перезапускается сразу
+                uptime = time.monotonic() - self.started_at[index]
+                if uptime > self.max_restart_delay:
+                    self.restart_delays[index] = self.min_restart_delay
+                delay = self.restart_delays[index]
+                self.restart_delays[index] = min(delay * 2,
+                                                 self.max_restart_delay)
+                self.processes[index] = None
+                task = asyncio.create_task(self._restart(index, delay))
+                self._restarting.add(task)
+                task.add_done_callback(self._restart_done)
+
+    def _restart_done(self, task: asyncio.Task) -> None:
+        self._restarting.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Не удалось перезапустить воркер',
+                         exc_info=task.exception())
+
+    async def _restart(self, index: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if not self._stopping:
+            self.restarts[index] += 1
+            self._start(index)
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Дает воркерам дообработать очередь и останавливает их"""
+        self._stopping = True
+        for task in list(self._restarting):
+            task.cancel()
+        for queue in self.queues:
+            queue.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(
+                process.join, max(0.0, deadline - time.monotonic())
+            )
+            if process.is_alive():
+                process.terminate()
+
+
+async def poll_updates(bot: Bot, supervisor: Supervisor,
+                       allowed_updates: List[str]) -> None:
+    """Long polling: получает обновления и раздает воркерам"""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=50, allowed_updates=allowed_updates,
+                request_timeout=60,
+            )
+        except Exception:
+            logger.exception('Ошибка получения обновлений')
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            supervisor.dispatch(update.model_dump(
+                mode='json', by_alias=True, exclude_unset=True
+            ))
+            offset = update.update_id + 1
+
+
+def create_ingress_app(bot: Bot, supervisor: Supervisor,
+                       secret_token: str) -> web.Application:
+    """Вебхук главного процесса: проверяет секрет и раздает обновления"""
+    async def receive(request: web.Request) -> web.Response:
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not secrets.compare_digest(token, secret_token):
+            return web.Response(body='Unauthorized', status=401)
+        supervisor.dispatch(await request.json(loads=bot.session.json_loads))
+        return web.json_response({})
+
+    async def healthz(request: web.Request) -> web.Response:
+        alive = supervisor.alive()
+        return web.json_response({
+            'status': 'ok' if all(alive) else 'degraded',
+            'workers': alive,
+            'restarts': supervisor.restarts,
+        }, status=200 if any(alive) else 503)
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, receive)
+    app.router.add_get('/healthz', healthz)
+    return app
+
+
+async def run(workers: int) -> None:
+    from main import create_bot, create_dispatcher
+    from webhook import set_webhook, webhook_secret
+
+    supervisor = Supervisor(workers, config.WEBHOOK_MAX_CONCURRENCY)
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+
+    bot = create_bot()
+    dp = create_dispatcher(bot)
+    runner = None
+    try:
+        if config.BOT_MODE == 'webhook':
+            runner = web.AppRunner(
+                create_ingress_app(bot, supervisor, webhook_secret())
+            )
+            await runner.setup()
+            await web.TCPSite(runner, config.WEBHOOK_HOST,
+                              config.WEBHOOK_PORT).start()
+            await set_webhook(bot, dp)
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook()
+            await poll_updates(bot, supervisor,
+                               dp.resolve_used_update_types())
+    finally:
+        watcher.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        await supervisor.stop()
+        await bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бот в нескольких процессах')
+    parser.add_argument('--workers', type=int,
+                        default=config.BOT_WORKERS or os.cpu_count() or 1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
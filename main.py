@@ -1,21 +1,93 @@
+import time
+
+# Отсчет времени запуска начинается до импорта тяжелых модулей
+IMPORT_STARTED = time.perf_counter()
+
 import asyncio
+import functools
+import logging
 
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from config import config
 from handlers.main_handler import router
+from services.forms import ya_forms
+from services.fsm_storage import create_storage
+from services.metrics import metrics_server
+from services.outbox import outbox
+from services.stt import stt
+from services.tts import tts
+from utils.constants import PREWARM_SEGMENTS, PREWARM_TEXTS
+from utils.handlers_util import get_voice_chunks, notify_submission
+from webhook import run_webhook
 
 
-async def start_bot():
-    bot = Bot(
+logger = logging.getLogger(__name__)
+
+
+async def on_startup(bot: Bot):
+    # Модель грузится в фоне, до ее готовности бот отвечает текстом
+    tts.start_warm_up(
+        (chunk for text in PREWARM_TEXTS
+         for chunk in get_voice_chunks(text)),
+        PREWARM_SEGMENTS
+    )
+    stt.start_warm_up()
+    await outbox.start(notify=functools.partial(notify_submission, bot))
+    logger.info('Время от импорта до приема обновлений: %.2f с',
+                time.perf_counter() - IMPORT_STARTED)
+
+
+def create_bot() -> Bot:
+    return Bot(
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher(bot=bot)
+
+
+def create_dispatcher(bot: Bot, isolate_events: bool = False) -> Dispatcher:
+    """
+    Диспетчер с роутером бота и общими хуками запуска и остановки.
+
+    `isolate_events` — обрабатывать обновления одного пользователя
+    по очереди, когда они приходят параллельно (вебхук, воркеры).
+    """
+    storage = create_storage()
+    if isolate_events:
+        dp = Dispatcher(bot=bot, storage=storage,
+                        events_isolation=SimpleEventIsolation())
+    else:
+        dp = Dispatcher(bot=bot, storage=storage)
     dp.include_router(router=router)
-    await dp.start_polling(bot)
+    dp.startup.register(ya_forms.start)
+    dp.startup.register(on_startup)
+    # Готовность выставляется после остальных хуков запуска
+    # и снимается первой при остановке
+    metrics_server.add_check('tts', lambda: tts.state)
+    metrics_server.add_check('stt', lambda: stt.enabled)
+    dp.startup.register(metrics_server.start)
+    dp.shutdown.register(metrics_server.stop)
+    dp.shutdown.register(outbox.close)
+    dp.shutdown.register(tts.shutdown)
+    dp.shutdown.register(stt.shutdown)
+    dp.shutdown.register(ya_forms.close)
+    # Хранилище FSM закрывает сам Dispatcher (хук fsm.close)
+    return dp
+
+
+async def start_bot():
+    bot = create_bot()
+    if config.BOT_MODE == 'webhook':
+        # Иначе параллельные запросы вебхука перепутают шаги анкеты
+        dp = create_dispatcher(bot, isolate_events=True)
+        await run_webhook(dp, bot)
+    else:
+        dp = create_dispatcher(bot)
+        await dp.start_polling(bot)
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(start_bot())
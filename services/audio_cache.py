@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import config
+from .metrics import metrics
+
+
+class AudioCache:
+    """
+    Кэш синтезированного аудио с адресацией по содержимому.
+
+    Два уровня:
+    - LRU в памяти, ограниченный суммарным размером в байтах;
+    - каталог на диске, ограниченный по размеру. При переполнении
+      удаляются файлы, к которым дольше всего не обращались.
+    """
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.memory_limit = memory_bytes
+        self.disk_limit = disk_bytes
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_size = 0
+        self._disk_size: Optional[int] = None
+        self._disk_lock = asyncio.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, speaker: str, sample_rate: int,
+                 format_audio: str, subtype: str,
+                 segmented: bool = False) -> str:
+        parts = [text, speaker, sample_rate, format_audio, subtype]
+        if segmented:
+            # Склейка по фрагментам звучит иначе, чем синтез целиком
+            parts.append('segments')
+        raw = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.bin')
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_limit:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+
+        data = await asyncio.to_thread(self._read_disk, key)
+        if data is not None:
+            self.disk_hits += 1
+            self._remember(key, data)
+            return data
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        async with self._disk_lock:
+            await asyncio.to_thread(self._write_disk, key, data)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime служит отметкой последнего обращения для вытеснения
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        if self._disk_size is None:
+            self._disk_size = sum(
+                entry['size'] for entry in self._scan_disk()
+            )
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            self._disk_size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        self._disk_size += len(data)
+        if self._disk_size > self.disk_limit:
+            self._evict_disk()
+
+    def _scan_disk(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.bin'):
+                    stat = entry.stat()
+                    entries.append({
+                        'path': entry.path,
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime
+                    })
+        return entries
+
+    def _evict_disk(self) -> None:
+        entries = sorted(self._scan_disk(), key=lambda e: e['mtime'])
+        self._disk_size = sum(entry['size'] for entry in entries)
+        for entry in entries:
+            if self._disk_size <= self.disk_limit:
+                break
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                continue
+            self._disk_size -= entry['size']
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_items': len(self._memory),
+            'memory_bytes': self._memory_size,
+            'disk_bytes': self._disk_size or 0,
+        }
+
+
+audio_cache = AudioCache(
+    directory=config.AUDIO_CACHE_DIR,
+    memory_bytes=config.AUDIO_CACHE_MEMORY_BYTES,
+    disk_bytes=config.AUDIO_CACHE_DISK_BYTES
+)
+
+
+def _cache_lookups() -> Dict[Tuple[str, ...], float]:
+    return {
+        ('memory_hit',): audio_cache.memory_hits,
+        ('disk_hit',): audio_cache.disk_hits,
+        ('miss',): audio_cache.misses,
+    }
+
+
+def _cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    hits = audio_cache.memory_hits + audio_cache.disk_hits
+    total = hits + audio_cache.misses
+    return {(): hits / total if total else 0}
+
+
+def _cache_bytes() -> Dict[Tuple[str, ...], float]:
+    stats = audio_cache.stats()
+    return {('memory',): stats['memory_bytes'],
+            ('disk',): stats['disk_bytes']}
+
+
+# Счетчики кэша читаются только при запросе метрик
+metrics.counter('bot_audio_cache_lookups_total',
+                'Обращения к кэшу аудио по результату', ('result',),
+                function=_cache_lookups)
+metrics.gauge('bot_audio_cache_hit_ratio',
+              'Доля попаданий в кэш аудио с запуска',
+              function=_cache_hit_ratio)
+metrics.gauge('bot_audio_cache_bytes', 'Размер кэша аудио', ('tier',),
+              function=_cache_bytes)
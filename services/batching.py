@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+
+class MicroBatcher:
+    """
+    Собирает одиночные запросы в пакеты.
+
+    Первый запрос открывает окно длиной `max_wait` секунд. Все запросы,
+    пришедшие за это время (но не больше `max_batch_size`), передаются
+    в `process_batch` одним списком. `process_batch` возвращает результаты
+    в том же порядке, и каждый вызывающий получает свой.
+    """
+    def __init__(self,
+                 process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int,
+                 max_wait: float,
+                 concurrency: int = 1):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.concurrency = max(1, concurrency)
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.batches = 0
+        self.items = 0
+        self.max_observed = 0
+
+    async def submit(self, item: Any) -> Any:
+        if self._collector is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._collector = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            # Запросы, которые уже отменили, не обрабатываем
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list) -> None:
+        try:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_observed = max(self.max_observed, len(batch))
+            try:
+                results = await self.process_batch(
+                    [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        for task in list(self._running):
+            task.cancel()
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_seconds': self.max_wait,
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0,
+            'max_observed_batch_size': self.max_observed,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+        }
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from config import config
+from .forms import YandexForms, ya_forms
+
+
+class ExportJobs:
+    """
+    Фоновые выгрузки отчетов.
+
+    Одновременные запросы отчета по одной форме и в одном формате
+    ждут одну общую выгрузку. Готовый файл хранится `result_ttl`
+    секунд и отдается повторным запросам без обращения к API.
+    """
+    def __init__(self, client: YandexForms, deadline: float = 300,
+                 result_ttl: float = 60):
+        self.client = client
+        self.deadline = deadline
+        self.result_ttl = result_ttl
+        self._jobs: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._results: Dict[Tuple[str, str], Tuple[float, bytes]] = {}
+        self.stats = {
+            'started': 0,
+            'joined': 0,
+            'cached': 0,
+            'failed': 0,
+        }
+
+    async def export(self, survey_id: str,
+                     format: str = 'xlsx') -> Optional[bytes]:
+        """Возвращает файл выгрузки, запуская ее только при необходимости."""
+        key = (survey_id, format)
+        cached = self._results.get(key)
+        if cached is not None:
+            finished_at, result = cached
+            if time.monotonic() - finished_at < self.result_ttl:
+                self.stats['cached'] += 1
+                return result
+            del self._results[key]
+
+        job = self._jobs.get(key)
+        if job is None:
+            self.stats['started'] += 1
+            job = asyncio.create_task(self._run(key))
+            self._jobs[key] = job
+            job.add_done_callback(lambda _: self._jobs.pop(key, None))
+        else:
+            self.stats['joined'] += 1
+        # Отмена одного ожидающего не должна останавливать общую выгрузку
+        return await asyncio.shield(job)
+
+    async def _run(self, key: Tuple[str, str]) -> Optional[bytes]:
+        survey_id, format = key
+        try:
+            result = await self.client.export_results(
+                survey_id=survey_id,
+                format=format,
+                deadline=self.deadline,
+            )
+        except Exception:
+            self.stats['failed'] += 1
+            raise
+        if result:
+            self._results[key] = (time.monotonic(), result)
+        return result
+
+    def invalidate(self, survey_id: str) -> None:
+        for key in [key for key in self._results if key[0] == survey_id]:
+            del self._results[key]
+
+
+export_jobs = ExportJobs(
+    ya_forms,
+    deadline=config.FORMS_EXPORT_DEADLINE,
+    result_ttl=config.FORMS_EXPORT_RESULT_TTL
+)
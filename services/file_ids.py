@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from config import config
+
+
+class VoiceFileIds:
+    """
+    Постоянное соответствие хэша аудио и `file_id` Telegram.
+
+    После первой отправки голосового сообщения Telegram возвращает
+    `file_id`, по которому то же аудио можно отправить повторно
+    без загрузки файла. Хранится в SQLite, для чтения держится копия
+    в памяти.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._ids: Optional[Dict[str, str]] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS voice_file_ids ('
+            'audio_hash TEXT PRIMARY KEY, '
+            'file_id TEXT NOT NULL, '
+            'updated_at REAL NOT NULL)'
+        )
+        return conn
+
+    def _load(self) -> Dict[str, str]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT audio_hash, file_id FROM voice_file_ids'
+            ).fetchall()
+        conn.close()
+        return dict(rows)
+
+    def _store(self, audio_hash: str, file_id: Optional[str]) -> None:
+        with self._connect() as conn:
+            if file_id is None:
+                conn.execute(
+                    'DELETE FROM voice_file_ids WHERE audio_hash = ?',
+                    (audio_hash,)
+                )
+            else:
+                conn.execute(
+                    'INSERT OR REPLACE INTO voice_file_ids '
+                    'VALUES (?, ?, ?)',
+                    (audio_hash, file_id, time.time())
+                )
+        conn.close()
+
+    async def _get_ids(self) -> Dict[str, str]:
+        if self._ids is None:
+            async with self._lock:
+                if self._ids is None:
+                    self._ids = await asyncio.to_thread(self._load)
+        return self._ids
+
+    async def get(self, audio_hash: str) -> Optional[str]:
+        ids = await self._get_ids()
+        return ids.get(audio_hash)
+
+    async def set(self, audio_hash: str, file_id: str) -> None:
+        ids = await self._get_ids()
+        if ids.get(audio_hash) == file_id:
+            return
+        ids[audio_hash] = file_id
+        async with self._lock:
+            await asyncio.to_thread(self._store, audio_hash, file_id)
+
+    async def discard(self, audio_hash: str) -> None:
+        """Забывает `file_id`, который Telegram больше не принимает."""
+        ids = await self._get_ids()
+        if ids.pop(audio_hash, None) is None:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._store, audio_hash, None)
+
+
+voice_file_ids = VoiceFileIds(config.VOICE_FILE_IDS_DB)
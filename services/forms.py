@@ -1,22 +1,326 @@
+import asyncio
+import hashlib
+import time
+from email.utils import parsedate_to_datetime
+
 import aiohttp
-from typing import Optional, Dict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Dict, Tuple
 
+from .metrics import FORMS_API_RESPONSES, FORMS_API_SECONDS, metrics
 from .models import FormData
 from config import config
 # from pprint import pprint
 
 
+class FormsAPIError(Exception):
+    """Ответ API Яндекс Форм с неуспешным статусом."""
+    def __init__(self, status: int, text: str):
+        super().__init__(f"Error {status}: {text}")
+        self.status = status
+        self.text = text
+
+    @property
+    def is_retryable(self) -> bool:
+        """Повтор имеет смысл при ошибках сервера и превышении лимитов."""
+        return self.status >= 500 or self.status in (408, 429)
+
+
+class TokenBucket:
+    """Ведро токенов: `rate` запросов в секунду, всплеск до `capacity`."""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже есть)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """
+    Общий асинхронный лимит запросов к API.
+
+    Запрос должен получить токен и из общего ведра, и из ведра своего
+    эндпоинта (если для него задан отдельный лимит). Когда токенов нет,
+    запросы ждут в очереди, и первыми обслуживаются запросы с меньшим
+    значением приоритета: отправка ответов раньше загрузки форм и выгрузок.
+    Ответ 429 с `Retry-After` приостанавливает выдачу токенов.
+    """
+    PRIORITY = {
+        'submit': 0,
+        'form': 1,
+        'export': 2,
+    }
+
+    def __init__(self, rate: float, burst: float,
+                 endpoint_rates: Optional[Dict[str, float]] = None):
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.endpoint_buckets = {
+            endpoint: TokenBucket(endpoint_rate, endpoint_rate)
+            for endpoint, endpoint_rate in (endpoint_rates or {}).items()
+            if endpoint_rate > 0
+        }
+        self._waiters: List[list] = []
+        self._sequence = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Пауза после 429 действует и без общего лимита (rate=0)
+        self.paused_until = 0.0
+        self.wait_stats: Dict[str, Dict[str, float]] = {}
+
+    def _wait_time(self, endpoint: str, now: float) -> float:
+        if now < self.paused_until:
+            return self.paused_until - now
+        buckets = [self.bucket, self.endpoint_buckets.get(endpoint)]
+        return max((bucket.wait_time(now) for bucket in buckets if bucket),
+                   default=0.0)
+
+    def _take(self, endpoint: str) -> None:
+        for bucket in (self.bucket, self.endpoint_buckets.get(endpoint)):
+            if bucket:
+                bucket.take()
+
+    def _record(self, endpoint: str, waited: float) -> None:
+        stats = self.wait_stats.setdefault(
+            endpoint, {'requests': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+        )
+        stats['requests'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+
+    async def acquire(self, endpoint: str) -> None:
+        """Ждет разрешения на запрос к `endpoint`."""
+        now = time.monotonic()
+        if not self._waiters and self._wait_time(endpoint, now) == 0:
+            self._take(endpoint)
+            self._record(endpoint, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        self._waiters.append([
+            self.PRIORITY.get(endpoint, len(self.PRIORITY)),
+            self._sequence, endpoint, future, now
+        ])
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            now = time.monotonic()
+            self._waiters = [w for w in self._waiters if not w[3].done()]
+            self._waiters.sort()
+            sleep_for = None
+            for waiter in self._waiters:
+                _, _, endpoint, future, queued_at = waiter
+                wait = self._wait_time(endpoint, now)
+                if wait == 0:
+                    self._take(endpoint)
+                    self._record(endpoint, now - queued_at)
+                    future.set_result(None)
+                    self._waiters.remove(waiter)
+                    sleep_for = 0
+                    break
+                if sleep_for is None or wait < sleep_for:
+                    sleep_for = wait
+            if sleep_for:
+                await asyncio.sleep(sleep_for)
+
+    def retry_after(self, seconds: float) -> None:
+        """Приостанавливает все запросы после ответа 429."""
+        self.paused_until = max(self.paused_until,
+                                time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'queue_depth': len(self._waiters),
+            'queue_by_endpoint': {
+                endpoint: sum(1 for w in self._waiters if w[2] == endpoint)
+                for endpoint in self.PRIORITY
+            },
+            'waits': {
+                endpoint: dict(
+                    stats,
+                    mean_wait=stats['total_wait'] / stats['requests']
+                )
+                for endpoint, stats in self.wait_stats.items()
+            },
+        }
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Разбирает `Retry-After`: число секунд или HTTP-дата."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0.0, moment.timestamp() - time.time())
+
+
 class BaseYandexForms:
-    def __init__(self):
+    """
+    Общая часть клиента: заголовки, HTTP-сессия и служебные запросы.
+
+    После `start()` все запросы идут через одну долгоживущую сессию
+    с пулом keep-alive соединений и кэшем DNS. Без нее (или если
+    сессия передана явно) поведение прежнее: сессия на один вызов.
+    """
+    def __init__(self,
+                 connection_limit: int = 100,
+                 connection_limit_per_host: int = 0,
+                 keepalive_timeout: float = 30,
+                 dns_cache_ttl: int = 300,
+                 timeout: float = 30,
+                 limiter: Optional[RateLimiter] = None,
+                 rate_limit_retries: int = 3):
         self.base_url = config.YAFORMS_BASE_URL
         self.api_base_url = config.FORMS_PUBLIC_API
         self.api_token = config.AUTH_YANDEX_FORMS
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.limiter = limiter
+        self.rate_limit_retries = rate_limit_retries
+        self.connection_stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0,
+        }
 
     def _headers(self) -> Dict[str, str]:
         return {
             'Authorization': f'Bearer {self.api_token}',
         }
 
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        stats = self.connection_stats
+
+        def counter(name):
+            async def on_event(session, context, params):
+                stats[name] += 1
+            return on_event
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(counter('requests'))
+        trace.on_connection_create_end.append(
+            counter('connections_created')
+        )
+        trace.on_connection_reuseconn.append(counter('connections_reused'))
+        trace.on_dns_cache_hit.append(counter('dns_cache_hits'))
+        trace.on_dns_cache_miss.append(counter('dns_cache_misses'))
+        return trace
+
+    async def start(self) -> None:
+        """Создает общую сессию. Вызывается при старте диспетчера."""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self) -> None:
+        """Закрывает общую сессию. Вызывается при остановке диспетчера."""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    @asynccontextmanager
+    async def _use_session(
+        self,
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> AsyncIterator[aiohttp.ClientSession]:
+        """
+        Отдает переданную сессию, общую сессию клиента или, если ее нет,
+        временную, которая закрывается после вызова.
+        """
+        if session is not None:
+            yield session
+        elif self._session is not None and not self._session.closed:
+            yield self._session
+        else:
+            async with aiohttp.ClientSession() as temporary:
+                yield temporary
+
+    @asynccontextmanager
+    async def _request(
+        self,
+        session: aiohttp.ClientSession,
+        endpoint: str,
+        method: str,
+        url: str,
+        **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Выполняет запрос в пределах лимита. На ответ 429 ждет
+        `Retry-After` и повторяет запрос не больше `rate_limit_retries` раз.
+        """
+        for attempt in range(self.rate_limit_retries + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire(endpoint)
+            # Время ответа без ожидания лимита
+            started = time.perf_counter()
+            try:
+                resp = await session.request(method, url, **kwargs)
+            except Exception:
+                FORMS_API_RESPONSES.inc(endpoint, 'error')
+                raise
+            finally:
+                FORMS_API_SECONDS.observe(time.perf_counter() - started,
+                                          endpoint)
+            FORMS_API_RESPONSES.inc(endpoint, str(resp.status))
+            if (resp.status == 429 and self.limiter is not None
+                    and attempt < self.rate_limit_retries):
+                self.limiter.retry_after(
+                    parse_retry_after(resp.headers.get('Retry-After'))
+                )
+                resp.release()
+                continue
+            try:
+                yield resp
+            finally:
+                resp.release()
+            return
+
+    def stats(self) -> Dict[str, object]:
+        stats = dict(self.connection_stats)
+        if self.limiter is not None:
+            stats['rate_limiter'] = self.limiter.stats()
+        return stats
+
     async def _start_export(
         self,
         survey_id: str,
@@ -26,14 +330,11 @@ class BaseYandexForms:
         """
         Запускает фоновый процесс экспорта ответов. Возвращает id операции.
         """
-        owns = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            owns = True
-        try:
+        async with self._use_session(session) as session:
             url = f'{self.api_base_url}/surveys/{survey_id}/answers/export'
             payload = {'format': format}
-            async with session.post(
+            async with self._request(
+                session, 'export', 'POST',
                 url,
                 headers=self._headers(),
                 json=payload,
@@ -41,31 +342,25 @@ class BaseYandexForms:
                 if resp.status == 202:
                     data = await resp.json()
                     return data.get('id')
-        finally:
-            if owns:
-                await session.close()
 
     async def _check_finished(
         self,
         operation_id: str,
         session: Optional[aiohttp.ClientSession] = None,
     ):
-        owns = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            owns = True
-        try:
+        async with self._use_session(session) as session:
             url = f'{self.api_base_url}/operations/{operation_id}'
-            async with session.get(
+            async with self._request(
+                session, 'export', 'GET',
                 url,
                 headers=self._headers(),
             ) as resp:
                 if resp.status == 200:
                     data = await resp.json()
+                    if data.get('status') == 'error':
+                        raise Exception(f"Export failed: {data}")
                     return data.get('status') == 'ok'
-        finally:
-            if owns:
-                await session.close()
+                return False
 
     async def _get_result(
         self,
@@ -73,25 +368,39 @@ class BaseYandexForms:
         operation_id: str,
         session: Optional[aiohttp.ClientSession] = None,
     ):
-        owns = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            owns = True
-        try:
+        async with self._use_session(session) as session:
             url = (
                 f'{self.api_base_url}/surveys/{survey_id}/answers/export-results'
             )
             params = {'task_id': operation_id}
-            async with session.get(
+            async with self._request(
+                session, 'export', 'GET',
                 url,
                 params=params,
                 headers=self._headers(),
             ) as resp:
                 if resp.status == 200:
                     return await resp.read()
-        finally:
-            if owns:
-                await session.close()
+
+
+class _LoadCancelled(Exception):
+    """Запрос, который загружал форму для всех ожидающих, отменен."""
+
+
+class SchemaEntry:
+    """Закэшированная структура формы и данные для ее перепроверки."""
+    def __init__(self, form: FormData, digest: str,
+                 etag: Optional[str] = None):
+        self.form = form
+        self.digest = digest
+        self.etag = etag
+        self.touch()
+
+    def touch(self) -> None:
+        self.checked_at = time.monotonic()
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.monotonic() - self.checked_at < ttl
 
 
 class YandexForms(BaseYandexForms):
@@ -107,38 +416,134 @@ class YandexForms(BaseYandexForms):
     переменной 'YAFORMS_BASE_URL'
     Базовый адрес API можно переопределить переменной `FORMS_PUBLIC_API`.
     Аутентификация: Bearer-токен в переменной окружения `AUTH_YANDEX_FORMS`.
+
+    Структура формы кэшируется на `schema_ttl` секунд. Одновременные
+    промахи по одной форме ждут один общий запрос. После истечения TTL
+    форма перепроверяется: через `If-None-Match`, если API вернул ETag,
+    иначе по хэшу тела ответа, и без изменений не разбирается заново.
     """
 
+    def __init__(self, *args, schema_ttl: float = 60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.schema_ttl = schema_ttl
+        self._schemas: Dict[str, SchemaEntry] = {}
+        self._schema_loads: Dict[str, asyncio.Future] = {}
+        self.schema_stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'revalidated': 0,
+            'reloaded': 0,
+        }
+
     async def get_form_data(
         self,
         survey_id: str,
         session: Optional[aiohttp.ClientSession] = None,
-    ):
+    ) -> FormData:
         """
         Возвращает структуру/вопросы формы по `survey_id`.
         """
-        owns = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            owns = True
+        while True:
+            entry = self._schemas.get(survey_id)
+            if entry is not None and entry.is_fresh(self.schema_ttl):
+                self.schema_stats['hits'] += 1
+                return entry.form
+
+            loading = self._schema_loads.get(survey_id)
+            if loading is None:
+                break
+            self.schema_stats['coalesced'] += 1
+            try:
+                return await asyncio.shield(loading)
+            except _LoadCancelled:
+                # Запрос, который загружал форму, отменен;
+                # загрузку продолжает один из ожидающих
+                continue
 
+        self.schema_stats['misses'] += 1
+
+        loading = asyncio.get_running_loop().create_future()
+        self._schema_loads[survey_id] = loading
         try:
+            form = await self._load_form_data(survey_id, entry, session)
+            loading.set_result(form)
+            return form
+        except asyncio.CancelledError:
+            # Ожидающие не отменяются вместе с владельцем, а повторяют запрос
+            loading.set_exception(_LoadCancelled())
+            loading.exception()
+            raise
+        except Exception as e:
+            loading.set_exception(e)
+            # Исключение уже передано вызывающему, ожидающих может не быть
+            loading.exception()
+            raise
+        finally:
+            del self._schema_loads[survey_id]
+
+    async def _load_form_data(
+        self,
+        survey_id: str,
+        entry: Optional['SchemaEntry'],
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> FormData:
+        headers = self._headers()
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+
+        async with self._use_session(session) as session:
             url = f'{self.api_base_url}/surveys/{survey_id}/form'
 
-            async with session.get(
+            async with self._request(
+                session, 'form', 'GET',
                 url,
-                headers=self._headers(),
+                headers=headers,
             ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    # pprint(data)
-                    return FormData(**data)
+                if resp.status == 304 and entry is not None:
+                    self.schema_stats['revalidated'] += 1
+                    entry.touch()
+                    return entry.form
+                elif resp.status == 200:
+                    body = await resp.read()
+                    etag = resp.headers.get('ETag')
                 else:
                     error_text = await resp.text()
-                    raise Exception(f"Error {resp.status}: {error_text}")
-        finally:
-            if owns:
-                await session.close()
+                    raise FormsAPIError(resp.status, error_text)
+
+        digest = hashlib.sha256(body).hexdigest()
+        if entry is not None and entry.digest == digest:
+            self.schema_stats['revalidated'] += 1
+            entry.etag = etag
+            entry.touch()
+            return entry.form
+
+        if entry is not None:
+            self.schema_stats['reloaded'] += 1
+        form = FormData.model_validate_json(body)
+        form.version = digest
+        self._schemas[survey_id] = SchemaEntry(form, digest, etag)
+        return form
+
+    def stats(self) -> Dict[str, object]:
+        stats = super().stats()
+        lookups = sum(self.schema_stats[k]
+                      for k in ('hits', 'misses', 'coalesced'))
+        stats.update({f'schema_{k}': v for k, v in self.schema_stats.items()})
+        stats['schema_hit_rate'] = (
+            self.schema_stats['hits'] / lookups if lookups else 0
+        )
+        return stats
+
+    def invalidate_form(self, survey_id: Optional[str] = None) -> None:
+        """
+        Сбрасывает кэш структуры формы (или всех форм), например
+        после того как оператор изменил форму.
+        """
+        if survey_id is None:
+            self._schemas.clear()
+        else:
+            self._schemas.pop(survey_id, None)
 
     async def fill_the_form(
         self,
@@ -147,15 +552,11 @@ class YandexForms(BaseYandexForms):
         session: Optional[aiohttp.ClientSession] = None,
     ):
         """Отправляет ответы в форму."""
-        owns = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            owns = True
-
-        try:
+        async with self._use_session(session) as session:
             url = f'{self.api_base_url}/surveys/{survey_id}/form'
 
-            async with session.post(
+            async with self._request(
+                session, 'submit', 'POST',
                 url,
                 json=answers,
                 headers=self._headers(),
@@ -164,27 +565,26 @@ class YandexForms(BaseYandexForms):
                     return True
                 else:
                     error_text = await resp.text()
-                    raise Exception(f"Error {resp.status}: {error_text}")
-
-        finally:
-            if owns:
-                await session.close()
+                    raise FormsAPIError(resp.status, error_text)
 
     async def export_results(
         self,
         survey_id: str,
         format: str,
         session: Optional[aiohttp.ClientSession] = None,
+        deadline: float = 300,
+        initial_delay: float = 0.5,
+        max_delay: float = 10,
     ):
         """
         Экспорт ответов. format in ('csv', 'xlsx')
         Возвращает bytes содержимое файла.
+
+        Статус операции опрашивается с экспоненциально растущей паузой
+        (от `initial_delay` до `max_delay` секунд). Если экспорт не готов
+        за `deadline` секунд, выбрасывается `asyncio.TimeoutError`.
         """
-        owns = False
-        if session is None:
-            session = aiohttp.ClientSession()
-            owns = True
-        try:
+        async with self._use_session(session) as session:
             operation_id = await self._start_export(
                 survey_id,
                 format,
@@ -193,12 +593,19 @@ class YandexForms(BaseYandexForms):
             if not operation_id:
                 return None
 
-            finished = False
-            while not finished:
-                finished = await self._check_finished(
-                    operation_id,
-                    session=session,
-                )
+            delay = initial_delay
+            give_up_at = time.monotonic() + deadline
+            while not await self._check_finished(
+                operation_id,
+                session=session,
+            ):
+                if time.monotonic() + delay > give_up_at:
+                    raise asyncio.TimeoutError(
+                        f'Экспорт {operation_id} не завершился '
+                        f'за {deadline} с'
+                    )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
 
             result = await self._get_result(
                 survey_id,
@@ -206,9 +613,76 @@ class YandexForms(BaseYandexForms):
                 session=session,
             )
             return result
-        finally:
-            if owns:
-                await session.close()
 
 
-ya_forms = YandexForms()
+ya_forms = YandexForms(
+    connection_limit=config.FORMS_HTTP_LIMIT,
+    connection_limit_per_host=config.FORMS_HTTP_LIMIT_PER_HOST,
+    keepalive_timeout=config.FORMS_HTTP_KEEPALIVE,
+    dns_cache_ttl=config.FORMS_HTTP_DNS_TTL,
+    timeout=config.FORMS_HTTP_TIMEOUT,
+    limiter=RateLimiter(
+        rate=config.FORMS_RATE_LIMIT,
+        burst=config.FORMS_RATE_BURST,
+        endpoint_rates=config.FORMS_ENDPOINT_RATE_LIMITS,
+    ),
+    rate_limit_retries=config.FORMS_RATE_LIMIT_RETRIES,
+    schema_ttl=config.FORMS_SCHEMA_TTL
+)
+
+
+def _limiter_queue() -> Dict[Tuple[str, ...], float]:
+    if ya_forms.limiter is None:
+        return {}
+    queue = ya_forms.limiter.stats()['queue_by_endpoint']
+    return {(endpoint,): depth for endpoint, depth in queue.items()}
+
+
+def _limiter_waits(field: str):
+    def collect() -> Dict[Tuple[str, ...], float]:
+        if ya_forms.limiter is None:
+            return {}
+        return {(endpoint,): stats[field]
+                for endpoint, stats in ya_forms.limiter.wait_stats.items()}
+    return collect
+
+
+def _connections() -> Dict[Tuple[str, ...], float]:
+    return {(event,): count
+            for event, count in ya_forms.connection_stats.items()}
+
+
+def _schema_lookups() -> Dict[Tuple[str, ...], float]:
+    return {(result,): count
+            for result, count in ya_forms.schema_stats.items()}
+
+
+def _schema_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    stats = ya_forms.schema_stats
+    lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+    return {(): stats['hits'] / lookups if lookups else 0}
+
+
+# Счетчики клиента читаются только при запросе метрик
+metrics.gauge('bot_forms_rate_limit_queue',
+              'Запросы к API, ожидающие лимита', ('endpoint',),
+              function=_limiter_queue)
+metrics.counter('bot_forms_rate_limit_requests_total',
+                'Запросы, прошедшие через лимит', ('endpoint',),
+                function=_limiter_waits('requests'))
+metrics.counter('bot_forms_rate_limit_wait_seconds_total',
+                'Суммарное ожидание лимита', ('endpoint',),
+                function=_limiter_waits('total_wait'))
+metrics.gauge('bot_forms_rate_limit_max_wait_seconds',
+              'Самое долгое ожидание лимита с запуска', ('endpoint',),
+              function=_limiter_waits('max_wait'))
+metrics.counter('bot_forms_http_events_total',
+                'Запросы, новые и повторно использованные соединения, '
+                'обращения к кэшу DNS', ('event',),
+                function=_connections)
+metrics.counter('bot_forms_schema_lookups_total',
+                'Обращения к кэшу структуры форм по результату', ('result',),
+                function=_schema_lookups)
+metrics.gauge('bot_forms_schema_hit_ratio',
+              'Доля попаданий в кэш структуры форм с запуска',
+              function=_schema_hit_ratio)
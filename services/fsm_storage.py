@@ -0,0 +1,432 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (BaseStorage, DefaultKeyBuilder,
+                                      KeyBuilder, StateType, StorageKey)
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+# Запись сессии: (состояние, данные в JSON)
+Record = Tuple[Optional[str], str]
+
+EMPTY_DATA = '{}'
+
+
+def dump_data(data: Mapping[str, Any]) -> str:
+    """Компактный JSON данных сессии"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def dump_record(record: Record) -> bytes:
+    state, data = record
+    return f'[{json.dumps(state, ensure_ascii=False)},{data}]'.encode()
+
+
+def load_record(raw: bytes) -> Record:
+    state, data = json.loads(raw)
+    return state, dump_data(data)
+
+
+class WriteBehindStorage(BaseStorage):
+    """
+    Хранилище FSM с отложенной пакетной записью.
+
+    Состояние и данные сессии хранятся одной записью. Изменения сразу
+    попадают в кэш в памяти, а в постоянное хранилище уходят пачкой
+    раз в `flush_interval` секунд или при накоплении `flush_batch`
+    изменений. При остановке бота несохраненные изменения дописываются
+    в `close`; при аварийном завершении теряются изменения не старше
+    `flush_interval`.
+
+    Наследники реализуют `_read(key)`, `_write(records)` и `_close()`.
+    """
+    def __init__(self, key_builder: Optional[KeyBuilder] = None,
+                 flush_interval: float = 0.2, flush_batch: int = 256,
+                 cache_size: int = 10000):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.cache_size = cache_size
+        self._records: 'OrderedDict[str, Record]' = OrderedDict()
+        self._dirty: set = set()
+        self._flushing: Dict[str, Record] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.flush_stats = {'flushes': 0, 'records': 0, 'errors': 0}
+
+    @abstractmethod
+    async def _read(self, key: str) -> Optional[Record]:
+        pass
+
+    @abstractmethod
+    async def _write(self, records: Dict[str, Optional[Record]]) -> None:
+        """Записывает пачку; `None` — удалить запись"""
+        pass
+
+    async def _close(self) -> None:
+        pass
+
+    async def _get_record(self, key: str) -> Record:
+        record = self._records.get(key)
+        if record is not None:
+            self._records.move_to_end(key)
+            return record
+
+        record = self._flushing.get(key)
+        if record is None:
+            record = await self._read(key) or (None, EMPTY_DATA)
+            # Пока читали, сессию могли изменить
+            if key in self._records:
+                return self._records[key]
+        self._records[key] = record
+        self._trim()
+        return record
+
+    def _put_record(self, key: str, record: Record) -> None:
+        self._records[key] = record
+        self._records.move_to_end(key)
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+        elif len(self._dirty) >= self.flush_batch:
+            self._flush_now.set()
+        self._trim()
+
+    def _trim(self) -> None:
+        """Вытесняет давно не использованные записи, кроме несохраненных"""
+        excess = len(self._records) - self.cache_size
+        if excess <= 0:
+            return
+        for key in list(self._records):
+            if excess <= 0:
+                break
+            if key not in self._dirty:
+                del self._records[key]
+                excess -= 1
+
+    async def _wait_flush(self) -> None:
+        """Ждет `flush_interval` или заполнения пачки"""
+        try:
+            await asyncio.wait_for(self._flush_now.wait(),
+                                   self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._flush_now.clear()
+
+    async def _flush_later(self) -> None:
+        while self._dirty:
+            await self._wait_flush()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записывает накопленные изменения одной пачкой"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch = {key: self._records[key] for key in self._dirty}
+            self._dirty.clear()
+            self._flushing = batch
+            try:
+                await self._write({
+                    key: None if record == (None, EMPTY_DATA) else record
+                    for key, record in batch.items()
+                })
+            except BaseException as e:
+                for key, record in batch.items():
+                    # Вернем в очередь, если сессию не успели изменить
+                    self._records.setdefault(key, record)
+                    self._dirty.add(key)
+                if not isinstance(e, Exception):
+                    raise
+                self.flush_stats['errors'] += 1
+                logger.exception('Не удалось сохранить %d сессий FSM',
+                                 len(batch))
+            else:
+                self.flush_stats['flushes'] += 1
+                self.flush_stats['records'] += len(batch)
+            finally:
+                self._flushing = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._get_record(storage_key)
+        if isinstance(state, State):
+            state = state.state
+        self._put_record(storage_key, (state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get_record(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f'Data must be a dict, got {type(data).__name__}')
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._get_record(storage_key)
+        self._put_record(storage_key, (state, dump_data(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get_record(self.key_builder.build(key))
+        return json.loads(data)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.flush_stats, cached=len(self._records),
+                    dirty=len(self._dirty))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
+        await self._close()
+
+
+class SQLiteStorage(WriteBehindStorage):
+    """Хранилище FSM во встроенной базе SQLite"""
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fsm ('
+                'key TEXT PRIMARY KEY, '
+                'record BLOB NOT NULL)'
+            )
+            self._conn = conn
+        return self._conn
+
+    def _select(self, key: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            'SELECT record FROM fsm WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, records: Dict[str, Optional[Record]]) -> None:
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO fsm (key, record) VALUES (?, ?)',
+                [(key, dump_record(record))
+                 for key, record in records.items() if record is not None]
+            )
+            conn.executemany(
+                'DELETE FROM fsm WHERE key = ?',
+                [(key,) for key, record in records.items() if record is None]
+            )
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    async def _read(self, key: str) -> Optional[Record]:
+        async with self._lock:
+            raw = await asyncio.to_thread(self._select, key)
+        return load_record(raw) if raw is not None else None
+
+    async def _write(self, records: Dict[str, Optional[Record]]) -> None:
+        async with self._lock:
+            await asyncio.to_thread(self._store, records)
+
+    async def _close(self) -> None:
+        async with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер Redis"""
+
+
+class RespClient:
+    """
+    Минимальный клиент протокола Redis (RESP2) на asyncio.
+
+    Одно соединение, команды отправляются конвейером: `pipeline`
+    пишет все команды разом и затем читает ответы по порядку.
+    """
+    def __init__(self, host: str = 'localhost', port: int = 6379,
+                 db: int = 0, password: Optional[str] = None,
+                 username: Optional[str] = None, timeout: float = 5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.username = username
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> 'RespClient':
+        parsed = urlparse(url)
+        path = parsed.path.lstrip('/')
+        return cls(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(path) if path else 0,
+            password=unquote(parsed.password) if parsed.password else None,
+            username=unquote(parsed.username) if parsed.username else None,
+            **kwargs
+        )
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('Redis closed the connection')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            return RespError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f'Unexpected RESP reply: {line!r}')
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        commands = []
+        if self.password:
+            if self.username:
+                commands.append(('AUTH', self.username, self.password))
+            else:
+                commands.append(('AUTH', self.password))
+        if self.db:
+            commands.append(('SELECT', self.db))
+        if commands:
+            await self._roundtrip(commands)
+
+    async def _roundtrip(self, commands: List[tuple]) -> list:
+        self._writer.write(b''.join(self.encode(*c) for c in commands))
+        await self._writer.drain()
+        replies = [await asyncio.wait_for(self._read_reply(), self.timeout)
+                   for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def pipeline(self, commands: List[tuple]) -> list:
+        """Выполняет команды одним конвейером и возвращает ответы"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._roundtrip(commands)
+                except (ConnectionError, OSError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError):
+                    await self._disconnect()
+                    if attempt:
+                        raise
+
+    async def execute(self, *args):
+        replies = await self.pipeline([args])
+        return replies[0]
+
+    async def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self._reader = self._writer = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._disconnect()
+
+
+class RedisStorage(WriteBehindStorage):
+    """
+    Хранилище FSM в Redis: одна строка на сессию. Если задан
+    `state_ttl`, брошенные сессии удаляются через столько секунд
+    после последнего изменения.
+    """
+    def __init__(self, client: RespClient, state_ttl: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.state_ttl = state_ttl
+
+    async def _read(self, key: str) -> Optional[Record]:
+        raw = await self.client.execute('GET', key)
+        return load_record(raw) if raw is not None else None
+
+    async def _write(self, records: Dict[str, Optional[Record]]) -> None:
+        commands = []
+        for key, record in records.items():
+            if record is None:
+                commands.append(('DEL', key))
+            elif self.state_ttl:
+                commands.append(('SET', key, dump_record(record),
+                                 'EX', self.state_ttl))
+            else:
+                commands.append(('SET', key, dump_record(record)))
+        await self.client.pipeline(commands)
+
+    async def _close(self) -> None:
+        await self.client.close()
+
+
+def create_storage() -> BaseStorage:
+    """Хранилище FSM по настройке `FSM_STORAGE`"""
+    options = {
+        'flush_interval': config.FSM_FLUSH_INTERVAL,
+        'flush_batch': config.FSM_FLUSH_BATCH,
+    }
+    if config.FSM_STORAGE == 'sqlite':
+        return SQLiteStorage(config.FSM_SQLITE_PATH, **options)
+    if config.FSM_STORAGE == 'redis':
+        return RedisStorage(RespClient.from_url(config.FSM_REDIS_URL),
+                            state_ttl=config.FSM_STATE_TTL, **options)
+    return MemoryStorage()
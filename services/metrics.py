@@ -0,0 +1,346 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Запись — обновление словаря в потоке цикла событий, без блокировок
+и выделения памяти на повторяющиеся метки, поэтому метрики можно
+оставлять включенными на горячем пути. Значения, которые и так
+считают сервисы (например, попадания в кэш аудио), читаются функцией
+только в момент запроса `/metrics`.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+from typing import (Any, Awaitable, Callable, Dict, Iterable, List, Optional,
+                    Tuple)
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+Collect = Callable[[], Dict[Labels, float]]
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(names: Labels, values: Labels,
+                   extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Labels = (),
+                 function: Optional[Collect] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Значения, которые вычисляются только при сборе метрик
+        self.function = function
+        self._values: Dict[Labels, float] = {}
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        values = self.function() if self.function else self._values
+        for labels, value in values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами; счетчики некумулятивные"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Labels = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счетчики корзин..., счетчик сверх последней, сумма]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str) -> 'Timer':
+        return Timer(self, labels)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        bounds = (*self.buckets, float('inf'))
+        for labels, series in self._series.items():
+            total = 0
+            for bound, count in zip(bounds, series):
+                total += count
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labelnames, labels,
+                                      f'le="{_format_value(bound)}"'),
+                       total)
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum', label_text, series[-1]
+            yield f'{self.name}_count', label_text, total
+
+
+class Timer:
+    """`with histogram.time(...)` — записывает длительность блока"""
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: Histogram, labels: Labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> 'Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started,
+                               *self.labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Labels = (),
+                function: Optional[Collect] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames,
+                                     function))
+
+    def gauge(self, name: str, documentation: str, labelnames: Labels = (),
+              function: Optional[Collect] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames,
+                                   function))
+
+    def histogram(self, name: str, documentation: str,
+                  labelnames: Labels = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception('Не удалось собрать метрику %s', metric.name)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+HANDLER_SECONDS = metrics.histogram(
+    'bot_handler_seconds', 'Время обработки сообщения обработчиком',
+    ('handler',)
+)
+HANDLER_ERRORS = metrics.counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ('handler',)
+)
+TTS_SECONDS = metrics.histogram(
+    'bot_tts_seconds', 'Синтез речи (synthesis) и кодирование (encode)',
+    ('stage',)
+)
+FORMS_API_SECONDS = metrics.histogram(
+    'bot_forms_api_seconds', 'Время ответа API Яндекс Форм', ('endpoint',)
+)
+FORMS_API_RESPONSES = metrics.counter(
+    'bot_forms_api_responses_total', 'Ответы API Яндекс Форм по кодам',
+    ('endpoint', 'status')
+)
+LOOP_LAG_SECONDS = metrics.histogram(
+    'bot_event_loop_lag_seconds', 'Опоздание таймера цикла событий',
+    buckets=LAG_BUCKETS
+)
+
+
+class SessionTracker:
+    """
+    Число сессий в каждом состоянии FSM в этом процессе.
+
+    Состояние пользователя запоминается после каждого его сообщения,
+    поэтому сессии, восстановленные из хранилища после перезапуска,
+    учитываются с первого сообщения.
+    """
+    def __init__(self, states: Iterable[str] = ()):
+        self.states: Dict[Any, str] = {}
+        self.counts = Tally({state: 0 for state in states})
+
+    def track(self, key: Any, state: Optional[str]) -> None:
+        previous = self.states.get(key)
+        if previous == state:
+            return
+        if previous is not None:
+            self.counts[previous] -= 1
+        if state is None:
+            self.states.pop(key, None)
+        else:
+            self.states[key] = state
+            self.counts[state] += 1
+
+    def collect(self) -> Dict[Labels, float]:
+        return {(state,): count for state, count in self.counts.items()}
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы обработчика, его ошибки и состояние сессии после него"""
+    def __init__(self, sessions: SessionTracker):
+        self.sessions = sessions
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            state = data.get('state')
+            if state is not None:
+                self.sessions.track(state.key, await state.get_state())
+
+
+async def monitor_event_loop(interval: float) -> None:
+    """Замеряет, насколько позже срока просыпается таймер цикла событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
+
+
+class MetricsServer:
+    """
+    Локальный HTTP-сервер с `/metrics` и `/ready`.
+
+    `/ready` отвечает 200 после запуска бота и 503 во время остановки,
+    с подробностями о готовности сервисов в JSON.
+    """
+    def __init__(self, host: str, port: int, lag_interval: float = 0.5,
+                 registry: MetricsRegistry = metrics):
+        self.host = host
+        self.port = port
+        self.lag_interval = lag_interval
+        self.registry = registry
+        self.ready = False
+        self.checks: Dict[str, Callable[[], Any]] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    def add_check(self, name: str, check: Callable[[], Any]) -> None:
+        """Состояние сервиса для ответа `/ready`, на готовность не влияет"""
+        self.checks[name] = check
+
+    def create_app(self) -> web.Application:
+        async def metrics_handler(request: web.Request) -> web.Response:
+            return web.Response(
+                body=self.registry.render().encode(),
+                headers={'Content-Type': CONTENT_TYPE},
+            )
+
+        async def ready_handler(request: web.Request) -> web.Response:
+            status = {'ready': self.ready}
+            for name, check in self.checks.items():
+                status[name] = check()
+            return web.json_response(status,
+                                     status=200 if self.ready else 503)
+
+        app = web.Application()
+        app.router.add_get('/metrics', metrics_handler)
+        app.router.add_get('/ready', ready_handler)
+        return app
+
+    async def start(self) -> None:
+        if self.lag_interval > 0 and self._monitor is None:
+            self._monitor = asyncio.create_task(
+                monitor_event_loop(self.lag_interval)
+            )
+        if self.port and self._runner is None:
+            self._runner = web.AppRunner(self.create_app(),
+                                         access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logger.info('Метрики: http://%s:%s/metrics',
+                        self.host, self.port)
+        self.ready = True
+
+    async def stop(self) -> None:
+        self.ready = False
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer(config.METRICS_HOST, config.METRICS_PORT,
+                               config.METRICS_LOOP_LAG_INTERVAL)
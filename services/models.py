@@ -55,3 +55,5 @@ class FormData(BaseModel):
     iframe: Optional[bool] = None
     texts: Texts
     pages: List[Page]
+    # Хэш структуры формы, проставляется клиентом при загрузке
+    version: Optional[str] = None
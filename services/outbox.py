@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import config
+from .forms import FormsAPIError, YandexForms, ya_forms
+
+
+logger = logging.getLogger(__name__)
+
+# notify(chat_id, delivered, error) — сообщить пользователю результат
+Notify = Callable[[int, bool, Optional[str]], Awaitable[None]]
+
+
+class SubmissionOutbox:
+    """
+    Надежная очередь отправки ответов в Яндекс Формы.
+
+    Ответы сначала записываются в SQLite, и только потом пользователь
+    получает подтверждение. Фоновые воркеры отправляют записи
+    с повторами и экспоненциальной паузой, а результат сообщают через
+    `notify`.
+
+    Ключ идемпотентности — хэш чата, формы и id отправки, который
+    создается, когда пользователь доходит до подтверждения ответов.
+    Повторное нажатие "Отправить" не создает второй записи, а
+    доставленная запись больше не отправляется. Новое заполнение той же
+    формы получает новый id, поэтому одинаковые ответы можно отправить
+    еще раз. API не принимает ключ идемпотентности, поэтому
+    при падении между ответом API и отметкой о доставке запись будет
+    отправлена еще раз (доставка "хотя бы один раз").
+
+    Очередь общая для всех процессов бота. Взятая запись помечается
+    владельцем (pid) и сроком аренды `lease`; если процесс упал и не
+    отметил результат, после истечения аренды запись забирает другой
+    воркер. Записи, которые сейчас отправляет живой процесс, не трогаются.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    DELIVERED = 'delivered'
+    FAILED = 'failed'
+
+    def __init__(self, path: str, client: YandexForms, workers: int = 2,
+                 max_attempts: int = 8, base_delay: float = 2,
+                 max_delay: float = 300, poll_interval: float = 5,
+                 lease: float = 300):
+        self.path = path
+        self.client = client
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        # Аренда должна быть дольше самой долгой отправки
+        self.lease = lease
+        self.owner = str(os.getpid())
+        self.notify: Optional[Notify] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def make_key(chat_id: int, survey_id: str, submission_id: str) -> str:
+        raw = json.dumps([chat_id, survey_id, submission_id],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS submissions ('
+            'key TEXT PRIMARY KEY, '
+            'chat_id INTEGER NOT NULL, '
+            'survey_id TEXT NOT NULL, '
+            'answers TEXT NOT NULL, '
+            'status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'next_attempt_at REAL NOT NULL, '
+            'last_error TEXT, '
+            'created_at REAL NOT NULL, '
+            'updated_at REAL NOT NULL, '
+            'owner TEXT, '
+            'lease_until REAL NOT NULL DEFAULT 0)'
+        )
+        columns = {row[1] for row in
+                   conn.execute('PRAGMA table_info(submissions)')}
+        # Файлы очереди, созданные до появления аренды
+        if 'owner' not in columns:
+            conn.execute('ALTER TABLE submissions ADD COLUMN owner TEXT')
+            conn.execute('ALTER TABLE submissions ADD COLUMN '
+                         'lease_until REAL NOT NULL DEFAULT 0')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS submissions_due '
+            'ON submissions (status, next_attempt_at)'
+        )
+        return conn
+
+    async def _execute(self, func, *args):
+        def run():
+            conn = self._connect()
+            try:
+                return func(conn, *args)
+            finally:
+                conn.close()
+        async with self._lock:
+            return await asyncio.to_thread(run)
+
+    @staticmethod
+    def _insert(conn, key, chat_id, survey_id, answers) -> bool:
+        now = time.time()
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO submissions (key, chat_id, survey_id, '
+            'answers, status, next_attempt_at, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, chat_id, survey_id, json.dumps(answers, ensure_ascii=False),
+             SubmissionOutbox.PENDING, now, now, now)
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _claim(conn, owner: str, lease: float) -> Optional[Tuple]:
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Готовые к отправке записи и записи с истекшей арендой:
+            # их владелец упал, не отметив результат
+            row = conn.execute(
+                'SELECT key, chat_id, survey_id, answers, attempts, status '
+                'FROM submissions WHERE (status = ? AND next_attempt_at <= ?) '
+                'OR (status = ? AND lease_until <= ?) '
+                'ORDER BY next_attempt_at LIMIT 1',
+                (SubmissionOutbox.PENDING, now,
+                 SubmissionOutbox.SENDING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE submissions SET status = ?, owner = ?, '
+                    'lease_until = ?, updated_at = ? WHERE key = ?',
+                    (SubmissionOutbox.SENDING, owner, now + lease, now,
+                     row[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    @staticmethod
+    def _update(conn, key, owner, status, attempts, next_attempt_at, error):
+        # Если аренда истекла и запись забрал другой воркер,
+        # результат отмечает он
+        conn.execute(
+            'UPDATE submissions SET status = ?, attempts = ?, '
+            'next_attempt_at = ?, last_error = ?, updated_at = ?, '
+            'owner = NULL, lease_until = 0 WHERE key = ? AND owner = ?',
+            (status, attempts, next_attempt_at, error, time.time(),
+             key, owner)
+        )
+
+    @staticmethod
+    def _release(conn, owner: str) -> int:
+        # Записи, которые этот процесс не успел отправить до остановки
+        cursor = conn.execute(
+            'UPDATE submissions SET status = ?, owner = NULL, '
+            'lease_until = 0 WHERE status = ? AND owner = ?',
+            (SubmissionOutbox.PENDING, SubmissionOutbox.SENDING, owner)
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    def _counts(conn) -> Dict[str, int]:
+        return dict(conn.execute(
+            'SELECT status, COUNT(*) FROM submissions GROUP BY status'
+        ).fetchall())
+
+    async def enqueue(self, chat_id: int, survey_id: str, answers: Dict,
+                      submission_id: str) -> bool:
+        """
+        Сохраняет ответы для отправки. Возвращает False, если отправка
+        с этим `submission_id` уже стоит в очереди или доставлена.
+        """
+        key = self.make_key(chat_id, survey_id, submission_id)
+        created = await self._execute(
+            self._insert, key, chat_id, survey_id, answers
+        )
+        if created and self._wakeup is not None:
+            self._wakeup.set()
+        return created
+
+    async def start(self, notify: Optional[Notify] = None) -> None:
+        """Запускает воркеры. Вызывается при старте диспетчера."""
+        self.notify = notify
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tasks:
+            await self._execute(self._release, self.owner)
+        self._tasks = []
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _worker(self) -> None:
+        while True:
+            row = await self._execute(self._claim, self.owner, self.lease)
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(),
+                                           self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            *row, status = row
+            if status == self.SENDING:
+                logger.info('Возобновлена отправка анкеты %s', row[0])
+            try:
+                await self._deliver(*row)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Ошибка обработки записи %s', row[0])
+
+    async def _deliver(self, key: str, chat_id: int, survey_id: str,
+                       answers: str, attempts: int) -> None:
+        attempts += 1
+        try:
+            await self.client.fill_the_form(survey_id, json.loads(answers))
+        except Exception as e:
+            permanent = (isinstance(e, FormsAPIError)
+                         and not e.is_retryable)
+            if permanent or attempts >= self.max_attempts:
+                await self._execute(self._update, key, self.owner,
+                                    self.FAILED, attempts, time.time(),
+                                    str(e))
+                await self._notify(chat_id, False, str(e))
+            else:
+                await self._execute(
+                    self._update, key, self.owner, self.PENDING, attempts,
+                    time.time() + self._retry_delay(attempts), str(e)
+                )
+            return
+
+        await self._execute(self._update, key, self.owner, self.DELIVERED,
+                            attempts, time.time(), None)
+        await self._notify(chat_id, True, None)
+
+    async def _notify(self, chat_id: int, delivered: bool,
+                      error: Optional[str]) -> None:
+        if self.notify is None:
+            return
+        try:
+            await self.notify(chat_id, delivered, error)
+        except Exception:
+            logger.exception('Не удалось уведомить чат %s', chat_id)
+
+    async def stats(self) -> Dict[str, int]:
+        return await self._execute(self._counts)
+
+
+outbox = SubmissionOutbox(
+    config.OUTBOX_DB,
+    ya_forms,
+    workers=config.OUTBOX_WORKERS,
+    max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+    lease=config.OUTBOX_LEASE_SECONDS
+)
@@ -1,44 +1,255 @@
-import torch
+import contextlib
+import hashlib
 import io
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
 import soundfile as sf
+import torch
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+# Фраза для проверки модели после оптимизаций
+PROBE_TEXT = 'Вопрос номер один. Ответьте да или нет.'
+
+
+def waveform_similarity(reference: torch.Tensor,
+                        candidate: torch.Tensor) -> Dict[str, Optional[float]]:
+    """
+    Сравнивает два сигнала одного текста: корреляция и отношение
+    сигнал/шум на общей части, а также отношение длительностей.
+    """
+    length = min(len(reference), len(candidate))
+    ref = reference[:length].double()
+    cand = candidate[:length].double()
+    noise = (ref - cand).pow(2).sum()
+    signal = ref.pow(2).sum()
+    if noise == 0:
+        # Сигналы совпадают, SNR не определен
+        snr = None
+    else:
+        snr = float(10 * torch.log10(signal / noise))
+    correlation = float(torch.corrcoef(torch.stack([ref, cand]))[0, 1])
+    return {
+        'correlation': correlation,
+        'snr_db': snr,
+        'length_ratio': len(candidate) / max(len(reference), 1),
+    }
+
+
+class ModelState:
+    NOT_LOADED = 'not_loaded'
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
 
 
 class Silero:
-    def __init__(self):
+    """
+    Модель Silero TTS с ленивой загрузкой.
+
+    Модель загружается при первом обращении (или заранее через `load`)
+    из локального файла `model_path`. Если задан `model_sha256`, файл
+    проверяется по хэшу, чтобы бот работал только с закрепленной версией.
+    Без локального файла модель скачивается через `torch.hub`,
+    если это разрешено.
+
+    В режиме `optimized` синтез идет под `torch.inference_mode`, а
+    внутренняя TorchScript-модель замораживается и оптимизируется для
+    инференса. `quantize` дополнительно включает динамическое int8
+    квантование. Каждая оптимизация принимается, только если сигнал
+    проверочной фразы почти не отличается от исходного, иначе
+    она откатывается.
+    """
+    # Минимальная корреляция с исходным сигналом и допустимое
+    # расхождение длительности для оптимизированной модели
+    min_correlation = 0.9
+    max_length_delta = 0.05
+
+    def __init__(self,
+                 model_path: str = '',
+                 model_sha256: str = '',
+                 allow_download: bool = True,
+                 hub_speaker: str = 'v3_1_ru',
+                 optimized: bool = False,
+                 quantize: bool = False):
         self.device = torch.device('cpu')
-        self._load_models()
+        self.model_path = model_path
+        self.model_sha256 = model_sha256
+        self.allow_download = allow_download
+        self.hub_speaker = hub_speaker
+        self.optimized = optimized
+        self.quantize = quantize
+        self.optimizations: List[str] = []
+        self.tts_model = None
+        self.state = ModelState.NOT_LOADED
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == ModelState.READY
+
+    def load(self):
+        """Загружает модель один раз, повторные вызовы ничего не делают."""
+        if self.tts_model is not None:
+            return self.tts_model
+        with self._lock:
+            if self.tts_model is not None:
+                return self.tts_model
+            self.state = ModelState.LOADING
+            try:
+                model = self._load_tts_model()
+            except Exception as e:
+                self.state = ModelState.FAILED
+                self.error = e
+                raise
+            model.to(self.device)
+            if self.optimized:
+                self._optimize(model)
+            self.tts_model = model
+            self.state = ModelState.READY
+            return model
+
+    def _verify_checksum(self) -> None:
+        digest = hashlib.sha256()
+        with open(self.model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != self.model_sha256.lower():
+            raise ValueError(
+                f'Хэш модели {self.model_path} не совпадает с '
+                f'SILERO_MODEL_SHA256'
+            )
+
+    def _load_tts_model(self):
+        if self.model_path:
+            if self.model_sha256:
+                self._verify_checksum()
+            # Модели Silero v3 распространяются как архивы torch.package
+            importer = torch.package.PackageImporter(self.model_path)
+            return importer.load_pickle('tts_models', 'model')
 
-    def _load_models(self):
-        self.tts_model, _ = torch.hub.load(
+        if not self.allow_download:
+            raise RuntimeError(
+                'Не задан SILERO_MODEL_PATH, а загрузка модели '
+                'из сети запрещена'
+            )
+        model, _ = torch.hub.load(
             repo_or_dir='snakers4/silero-models',
             model='silero_tts',
             language='ru',
-            speaker='v3_1_ru'
+            speaker=self.hub_speaker
         )
-        self.tts_model.to(self.device)
+        return model
 
-        self.stt_model, self.stt_decoder, self.stt_utils = torch.hub.load(
-            repo_or_dir='snakers4/silero-models',
-            model='silero_stt',
-            language='en',
-            device=self.device
-        )
-        self.stt_model.to(self.device)
+    def _inference_context(self):
+        if self.optimized:
+            return torch.inference_mode()
+        return contextlib.nullcontext()
 
-    def text_to_speech(self,
-                       text: str,
-                       speaker: str = 'xenia',
-                       sample_rate: int = 48000,
-                       subtype: str = 'OPUS',
-                       format_audio: str = 'OGG'):
-        torch.set_num_threads(4)
+    def _probe(self, model) -> torch.Tensor:
+        with torch.inference_mode():
+            return model.apply_tts(text=PROBE_TEXT, speaker='xenia',
+                                   sample_rate=24000)
 
-        audio = self.tts_model.apply_tts(
-            text=text,
-            speaker=speaker,
-            sample_rate=sample_rate
-        )
+    def _try_optimization(self, model, name: str, transform,
+                          reference: torch.Tensor) -> None:
+        """
+        Заменяет внутреннюю модель результатом `transform`, если он
+        работает и звучит так же, иначе оставляет прежнюю.
+        """
+        original = model.model
+        try:
+            model.model = transform(original)
+            similarity = waveform_similarity(reference, self._probe(model))
+        except Exception as e:
+            model.model = original
+            logger.warning('Оптимизация %s не применена: %s', name, e)
+            return
+        if (similarity['correlation'] < self.min_correlation
+                or abs(similarity['length_ratio'] - 1)
+                > self.max_length_delta):
+            model.model = original
+            logger.warning('Оптимизация %s ухудшает звук (%s), отключена',
+                           name, similarity)
+            return
+        self.optimizations.append(name)
+
+    def _optimize(self, model) -> None:
+        self.optimizations = ['inference_mode']
+        if not hasattr(model, 'model'):
+            logger.warning('У модели нет внутреннего модуля, '
+                           'доступен только inference_mode')
+            return
+        reference = self._probe(model)
+
+        def freeze(module):
+            if not isinstance(module, torch.jit.ScriptModule):
+                raise TypeError('модель не TorchScript')
+            frozen = torch.jit.freeze(module.eval())
+            return torch.jit.optimize_for_inference(frozen)
+
+        def quantize(module):
+            if isinstance(module, torch.jit.ScriptModule):
+                raise TypeError(
+                    'динамическое квантование не поддерживает TorchScript'
+                )
+            return torch.ao.quantization.quantize_dynamic(
+                module, {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU},
+                dtype=torch.qint8
+            )
+
+        if self.quantize:
+            # Квантование применяется к исходному модулю до заморозки
+            self._try_optimization(model, 'quantize_int8', quantize,
+                                   reference)
+        self._try_optimization(model, 'freeze', freeze, reference)
+        logger.info('Оптимизации TTS: %s', ', '.join(self.optimizations))
+
+    def synthesize(self,
+                   text: str,
+                   speaker: str = 'xenia',
+                   sample_rate: int = 48000) -> torch.Tensor:
+        """Возвращает несжатый сигнал (float32, моно)."""
+        model = self.load()
+        with self._inference_context():
+            return model.apply_tts(
+                text=text,
+                speaker=speaker,
+                sample_rate=sample_rate
+            )
+
+    def synthesize_batch(
+        self, requests: List[Tuple[str, str, int]]
+    ) -> List[torch.Tensor]:
+        """
+        Синтезирует пакет запросов (text, speaker, sample_rate).
 
+        `apply_tts` моделей v3 принимает один текст, поэтому пакет
+        проходит по модели последовательно, но одинаковые запросы
+        синтезируются один раз.
+        """
+        results: Dict[Tuple[str, str, int], torch.Tensor] = {}
+        for request in requests:
+            if request not in results:
+                text, speaker, sample_rate = request
+                results[request] = self.synthesize(
+                    text=text,
+                    speaker=speaker,
+                    sample_rate=sample_rate
+                )
+        return [results[request] for request in requests]
+
+    @staticmethod
+    def encode(audio,
+               sample_rate: int = 48000,
+               subtype: str = 'OPUS',
+               format_audio: str = 'OGG') -> bytes:
         audio_buffer = io.BytesIO()
         sf.write(
             audio_buffer,
@@ -51,5 +262,24 @@ class Silero:
 
         return audio_buffer.getvalue()
 
+    def text_to_speech(self,
+                       text: str,
+                       speaker: str = 'xenia',
+                       sample_rate: int = 48000,
+                       subtype: str = 'OPUS',
+                       format_audio: str = 'OGG'):
+        audio = self.synthesize(
+            text=text,
+            speaker=speaker,
+            sample_rate=sample_rate
+        )
+        return self.encode(audio, sample_rate, subtype, format_audio)
+
 
-silero = Silero()
+silero = Silero(
+    model_path=config.SILERO_MODEL_PATH,
+    model_sha256=config.SILERO_MODEL_SHA256,
+    allow_download=config.SILERO_ALLOW_DOWNLOAD,
+    optimized=config.TTS_OPTIMIZED,
+    quantize=config.TTS_QUANTIZE
+)
@@ -0,0 +1,159 @@
+import asyncio
+import functools
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set
+
+from config import config
+from .batching import MicroBatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+class SpeechRecognizer:
+    """
+    Распознавание голосовых ответов моделью Silero STT.
+
+    Публичные модели Silero STT в torch.hub не включают русский язык,
+    поэтому модель (TorchScript, `.jit`) берется из локального файла
+    `model_path`. Без него распознавание выключено.
+
+    Запросы от разных пользователей собираются `MicroBatcher` в пакет
+    и распознаются одним прогоном модели.
+    """
+    sample_rate = 16000
+    blank = '_'
+    repeat = '2'
+
+    def __init__(self, model_path: str = '', batch_size: int = 8,
+                 batch_wait: float = 0.05):
+        self.model_path = model_path
+        self.model = None
+        self.labels: List[str] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='stt'
+        )
+        self.batcher = MicroBatcher(
+            self._recognize_batch, batch_size, batch_wait
+        )
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.model_path)
+
+    def load(self):
+        if self.model is not None:
+            return self.model
+        with self._lock:
+            if self.model is None:
+                import torch
+                model = torch.jit.load(self.model_path, map_location='cpu')
+                model.eval()
+                self.labels = list(model.labels)
+                self.model = model
+        return self.model
+
+    def _read_audio(self, payload: bytes):
+        """Декодирует OGG/Opus из Telegram в моно 16 кГц."""
+        import soundfile as sf
+        import torch
+        import torchaudio.functional as AF
+
+        audio, sample_rate = sf.read(io.BytesIO(payload), dtype='float32')
+        wave = torch.from_numpy(audio)
+        if wave.dim() > 1:
+            wave = wave.mean(dim=1)
+        if sample_rate != self.sample_rate:
+            wave = AF.resample(wave, sample_rate, self.sample_rate)
+        return wave
+
+    def _decode(self, probs) -> str:
+        """Жадное CTC-декодирование с соглашениями меток Silero."""
+        chars = []
+        previous = None
+        for index in probs.argmax(dim=-1).tolist():
+            if index == previous:
+                continue
+            previous = index
+            label = self.labels[index]
+            if label == self.blank:
+                continue
+            if label == self.repeat:
+                if chars:
+                    chars.append(chars[-1])
+                continue
+            chars.append(label)
+        return ' '.join(''.join(chars).split())
+
+    def _read_or_none(self, payload: bytes):
+        try:
+            return self._read_audio(payload)
+        except Exception as e:
+            logger.warning('Не удалось декодировать голосовое: %s', e)
+            return None
+
+    def _recognize_sync(self, payloads: List[bytes]) -> List[Optional[str]]:
+        import torch
+
+        model = self.load()
+        # Битое сообщение одного пользователя не ломает пакет остальных
+        waves = [self._read_or_none(payload) for payload in payloads]
+        decoded = [wave for wave in waves if wave is not None]
+        if not decoded:
+            return [None] * len(payloads)
+        inputs = torch.zeros(len(decoded), max(len(wave) for wave in decoded))
+        for i, wave in enumerate(decoded):
+            inputs[i, :len(wave)] = wave
+        with torch.inference_mode():
+            output = iter(model(inputs))
+        return [None if wave is None else self._decode(next(output))
+                for wave in waves]
+
+    async def _recognize_batch(
+        self, payloads: List[bytes]
+    ) -> List[Optional[str]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self._recognize_sync, payloads)
+        )
+
+    async def recognize(self, payload: bytes) -> Optional[str]:
+        """Возвращает распознанный текст голосового сообщения."""
+        if not self.enabled:
+            return None
+        return await self.batcher.submit(payload)
+
+    def start_warm_up(self) -> None:
+        if not self.enabled:
+            return
+
+        async def run():
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.load
+                )
+            except Exception as e:
+                logger.error('Модель STT не загружена: %s', e)
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def shutdown(self) -> None:
+        await self.batcher.close()
+        await asyncio.to_thread(
+            self._executor.shutdown, wait=True, cancel_futures=True
+        )
+
+
+stt = SpeechRecognizer(
+    model_path=config.STT_MODEL_PATH,
+    batch_size=config.STT_BATCH_SIZE,
+    batch_wait=config.STT_BATCH_WAIT_MS / 1000
+)
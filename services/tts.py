@@ -0,0 +1,429 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from itertools import chain
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (AsyncIterator, Awaitable, Callable, Dict, Iterable, List,
+                    Optional, Set, Tuple)
+
+from config import config
+from .audio_cache import AudioCache, audio_cache
+from .batching import MicroBatcher
+from .metrics import TTS_SECONDS, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class _ProducerCancelled(Exception):
+    """Запрос, который готовил общее аудио, отменен до результата."""
+
+
+def _init_worker(torch_threads: int) -> None:
+    """Настраивает torch в воркере пула один раз при его запуске."""
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def _warm_up() -> None:
+    """Загружает модель в воркере пула."""
+    from services.silero import silero
+    silero.load()
+
+
+def _synthesize_batch(requests: List[Tuple[str, str, int]]) -> List[bytes]:
+    """
+    Синтезирует пакет запросов (text, speaker, sample_rate) за один заход
+    в воркер. Возвращает сырые float32 отсчеты для каждого запроса.
+    """
+    from services.silero import silero
+    return [
+        audio.numpy().astype('float32').tobytes()
+        for audio in silero.synthesize_batch(requests)
+    ]
+
+
+def _encode_pcm(fragments: List[bytes], sample_rate: int, pause: float,
+                subtype: str, format_audio: str) -> bytes:
+    """Склеивает фрагменты через паузы и кодирует результат один раз."""
+    import numpy as np
+    from services.silero import Silero
+
+    silence = np.zeros(int(sample_rate * pause), dtype=np.float32)
+    parts = []
+    for fragment in fragments:
+        if parts:
+            parts.append(silence)
+        parts.append(np.frombuffer(fragment, dtype=np.float32))
+    return Silero.encode(np.concatenate(parts), sample_rate,
+                         subtype, format_audio)
+
+
+def pool_size(executor: str, workers: int = 0,
+              torch_threads: int = 0) -> Tuple[int, int]:
+    """
+    Возвращает (количество воркеров, потоков torch на воркер).
+
+    В режиме 'process' ядра делятся между процессами. В режиме 'thread'
+    потоки torch общие для всего процесса, поэтому их число не делится
+    между воркерами. Воркеры `launcher.py` получают долю ядер через
+    явные `workers` и `torch_threads`.
+    """
+    cpu_count = os.cpu_count() or 1
+    if executor == 'process':
+        workers = workers or max(1, cpu_count // 2)
+        torch_threads = torch_threads or max(1, cpu_count // workers)
+    else:
+        workers = workers or 2
+        torch_threads = torch_threads or min(4, cpu_count)
+    return workers, torch_threads
+
+
+class TTSService:
+    """
+    Асинхронная обертка над Silero TTS.
+
+    Синтез выполняется в отдельном пуле потоков или процессов, чтобы
+    долгая генерация аудио не блокировала обработку апдейтов
+    остальных пользователей. Готовое аудио берется из `AudioCache`,
+    одновременные запросы одного и того же текста синтезируются один раз.
+
+    Составные тексты (например, вопросы формы) можно озвучивать
+    по фрагментам: каждый фрагмент синтезируется и кэшируется отдельно
+    в несжатом виде, а затем фрагменты склеиваются и кодируются в Opus.
+
+    Промахи кэша, пришедшие почти одновременно, собираются `MicroBatcher`
+    в пакеты. Одинаковые тексты пакета синтезируются один раз, а разные
+    делятся поровну между всеми воркерами пула.
+    """
+    # Пауза между фрагментами, секунды
+    segment_pause = 0.3
+
+    # Состояния готовности совпадают с `services.silero.ModelState`,
+    # но отслеживаются здесь: в режиме 'process' модели в этом процессе нет
+    NOT_LOADED = 'not_loaded'
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self, executor: str = 'thread', workers: int = 0,
+                 torch_threads: int = 0,
+                 cache: Optional[AudioCache] = None,
+                 batch_size: int = 16,
+                 batch_wait: float = 0.01):
+        self.executor_kind = executor
+        self.workers, self.torch_threads = pool_size(
+            executor, workers, torch_threads
+        )
+        self.cache = cache
+        # Пакетов в работе не больше, чем воркеров в пуле
+        self.batcher = MicroBatcher(
+            self._synthesize_batch, batch_size, batch_wait,
+            concurrency=self.workers
+        )
+        self._executor: Optional[Executor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+        self.state = self.NOT_LOADED
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == self.READY
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.torch_threads,)
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='tts',
+                    initializer=_init_worker,
+                    initargs=(self.torch_threads,)
+                )
+        return self._executor
+
+    async def text_to_speech(self,
+                             text: str,
+                             speaker: str = 'xenia',
+                             sample_rate: int = 48000,
+                             subtype: str = 'OPUS',
+                             format_audio: str = 'OGG',
+                             batched: bool = True) -> bytes:
+        return await self._cached(
+            (text, speaker, sample_rate, format_audio, subtype),
+            functools.partial(
+                self._render, text, speaker,
+                sample_rate, subtype, format_audio, batched
+            )
+        )
+
+    async def stream(self,
+                     chunks: Iterable[str],
+                     speaker: str = 'xenia',
+                     sample_rate: int = 48000,
+                     subtype: str = 'OPUS',
+                     format_audio: str = 'OGG') -> AsyncIterator[bytes]:
+        """
+        Озвучивает части длинного текста и отдает их по порядку.
+
+        Все части ставятся в пул сразу, поэтому первая часть отдается,
+        как только готова она одна, а остальные синтезируются в фоне.
+        Части не объединяются в пакет: иначе первая ждала бы всех.
+        """
+        tasks = [
+            asyncio.ensure_future(self.text_to_speech(
+                chunk, speaker, sample_rate, subtype, format_audio,
+                batched=False
+            ))
+            for chunk in chunks
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _render(self, text: str, speaker: str, sample_rate: int,
+                      subtype: str, format_audio: str,
+                      batched: bool = True) -> bytes:
+        request = (text, speaker, sample_rate)
+        if batched:
+            pcm = await self.batcher.submit(request)
+        else:
+            pcm, = await self._synthesize_batch([request])
+        # Несжатый сигнал целого текста не кэшируется: он слишком велик
+        return await self._encode([pcm], sample_rate, 0.0, subtype,
+                                  format_audio)
+
+    async def segments_to_speech(self,
+                                 segments: Iterable[str],
+                                 speaker: str = 'xenia',
+                                 sample_rate: int = 48000,
+                                 subtype: str = 'OPUS',
+                                 format_audio: str = 'OGG') -> bytes:
+        """Озвучивает текст, составленный из отдельно кэшируемых частей."""
+        segments = [segment.strip() for segment in segments]
+        segments = [segment for segment in segments if segment]
+        return await self._cached(
+            ('\n'.join(segments), speaker, sample_rate,
+             format_audio, subtype, True),
+            functools.partial(
+                self._compose, segments, speaker,
+                sample_rate, subtype, format_audio
+            )
+        )
+
+    async def _compose(self, segments: List[str], speaker: str,
+                       sample_rate: int, subtype: str,
+                       format_audio: str) -> bytes:
+        fragments = await asyncio.gather(*(
+            self._segment(segment, speaker, sample_rate)
+            for segment in segments
+        ))
+        return await self._encode(list(fragments), sample_rate,
+                                  self.segment_pause, subtype, format_audio)
+
+    async def _segment(self, segment: str, speaker: str,
+                       sample_rate: int) -> bytes:
+        """Несжатое аудио одного фрагмента составного текста."""
+        return await self._cached(
+            (segment, speaker, sample_rate, 'PCM', 'FLOAT'),
+            functools.partial(
+                self.batcher.submit, (segment, speaker, sample_rate)
+            )
+        )
+
+    async def _cached(self, key_parts: tuple,
+                      produce: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Возвращает аудио из кэша или вызывает `produce` один раз."""
+        if self.cache is None:
+            return await produce()
+
+        key = self.cache.make_key(*key_parts)
+        while key in self._inflight:
+            try:
+                return await asyncio.shield(self._inflight[key])
+            except _ProducerCancelled:
+                # Пользователь, чей запрос готовил аудио, ушел;
+                # аудио готовит один из оставшихся ожидающих
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            audio = await self.cache.get(key)
+            if audio is None:
+                audio = await produce()
+                await self.cache.set(key, audio)
+            future.set_result(audio)
+            return audio
+        except asyncio.CancelledError:
+            # Ожидающие не отменяются вместе с владельцем, а повторяют запрос
+            future.set_exception(_ProducerCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано вызывающему, ожидающих может не быть
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _synthesize_batch(
+        self, requests: List[Tuple[str, str, int]]
+    ) -> List[bytes]:
+        with TTS_SECONDS.time('synthesis'):
+            # Пакет целиком в одном воркере ждал бы последовательно,
+            # пока остальные простаивают
+            unique = list(dict.fromkeys(requests))
+            size = -(-len(unique) // self.workers)
+            parts = await asyncio.gather(*(
+                self._run(_synthesize_batch, unique[start:start + size])
+                for start in range(0, len(unique), size)
+            ))
+        audio = dict(zip(unique, chain.from_iterable(parts)))
+        return [audio[request] for request in requests]
+
+    async def _encode(self, fragments: List[bytes], sample_rate: int,
+                      pause: float, subtype: str, format_audio: str) -> bytes:
+        with TTS_SECONDS.time('encode'):
+            return await self._run(_encode_pcm, fragments, sample_rate,
+                                   pause, subtype, format_audio)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            functools.partial(func, *args)
+        )
+
+    async def warm_up(self) -> None:
+        """
+        Загружает модель во всех воркерах пула.
+
+        Сервис считается готовым, как только модель загрузилась хотя бы
+        в одном воркере: остальные догрузят ее при первом запросе.
+        """
+        if self.state in (self.LOADING, self.READY):
+            return
+        self.state = self.LOADING
+        count = self.workers if self.executor_kind == 'process' else 1
+        pending = {
+            asyncio.ensure_future(self._run(_warm_up))
+            for _ in range(count)
+        }
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    self.state = self.READY
+                else:
+                    error = task.exception()
+        if self.state != self.READY:
+            self.state = self.FAILED
+            logger.error('Модель TTS не загружена: %s', error)
+            raise error
+
+    async def prewarm(self, texts: Iterable[str],
+                      segments: Iterable[str] = ()) -> None:
+        """
+        Заранее синтезирует и кладет в кэш аудио статичных текстов.
+        `segments` озвучиваются только в составе других текстов
+        (`segments_to_speech`), поэтому кэшируются как фрагменты.
+        """
+        for text in texts:
+            await self.text_to_speech(text=text)
+        for segment in segments:
+            await self._segment(segment.strip(), 'xenia', 48000)
+
+    def start_warm_up(self, prewarm_texts: Iterable[str] = (),
+                      prewarm_segments: Iterable[str] = ()) -> None:
+        """
+        Загружает модель и готовит аудио статичных текстов в фоне,
+        не задерживая старт бота.
+        """
+        prewarm_texts = tuple(prewarm_texts)
+        prewarm_segments = tuple(prewarm_segments)
+
+        async def run():
+            started = time.perf_counter()
+            try:
+                await self.warm_up()
+            except Exception:
+                # Ошибка уже записана в лог, бот продолжает работать текстом
+                return
+            logger.info('Модель TTS загружена за %.2f с',
+                        time.perf_counter() - started)
+            await self.prewarm(prewarm_texts, prewarm_segments)
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'state': self.state,
+            'batching': self.batcher.stats(),
+            'cache': self.cache.stats() if self.cache else {},
+        }
+
+    async def shutdown(self) -> None:
+        """Останавливает пул, отменяя задачи, которые еще не начаты."""
+        for task in list(self._background):
+            task.cancel()
+        await self.batcher.close()
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(
+            executor.shutdown, wait=True, cancel_futures=True
+        )
+
+
+tts = TTSService(
+    executor=config.TTS_EXECUTOR,
+    workers=config.TTS_WORKERS,
+    torch_threads=config.TTS_TORCH_THREADS,
+    cache=audio_cache,
+    batch_size=config.TTS_BATCH_SIZE,
+    batch_wait=config.TTS_BATCH_WAIT_MS / 1000
+)
+
+
+def _batch_counts() -> Dict[Tuple[str, ...], float]:
+    stats = tts.batcher.stats()
+    return {('batches',): stats['batches'], ('items',): stats['items']}
+
+
+def _batch_sizes() -> Dict[Tuple[str, ...], float]:
+    stats = tts.batcher.stats()
+    return {('mean',): stats['mean_batch_size'],
+            ('max',): stats['max_observed_batch_size']}
+
+
+def _batch_queue() -> Dict[Tuple[str, ...], float]:
+    return {(): tts.batcher.stats()['queue_depth']}
+
+
+# Статистика пакетов синтеза читается только при запросе метрик
+metrics.counter('bot_tts_batched_total',
+                'Пакеты синтеза (batches) и тексты в них (items)', ('kind',),
+                function=_batch_counts)
+metrics.gauge('bot_tts_batch_size', 'Средний и наибольший размер пакета',
+              ('stat',), function=_batch_sizes)
+metrics.gauge('bot_tts_batch_queue_depth',
+              'Тексты, ожидающие сборки в пакет', function=_batch_queue)
@@ -0,0 +1,112 @@
+import asyncio
+
+from services.models import (Condition, ConditionItem, FormData, FormItem,
+                             ItemOption, Page, Texts)
+from utils.form_utils import compile_form
+
+
+def shown_if(question: str, value: str, condition: str = 'eq'):
+    return [Condition(operator='and', items=[ConditionItem(
+        type='question', condition=condition, question=question, value=value
+    )])]
+
+
+# b показывается, если в a выбран o1; c — если b показан и равен 'x';
+# у d условие неизвестного вида, поэтому он показывается всегда
+form = FormData(
+    id='conditions',
+    name='Условия',
+    texts=Texts(submit='Отправить', back='Назад', next='Далее'),
+    pages=[Page(items=[
+        FormItem(id='a', label='A', hidden=False, type='enum',
+                 widget='radio',
+                 items=[ItemOption(id=f'o{i}', label=f'Вариант {i}')
+                        for i in range(3)]),
+        FormItem(id='b', label='B', hidden=False, type='string',
+                 conditions=shown_if('a', 'o1')),
+        FormItem(id='c', label='C', hidden=False, type='string',
+                 conditions=shown_if('b', 'x')),
+        FormItem(id='d', label='D', hidden=False, type='string',
+                 conditions=shown_if('a', 'o', condition='contains')),
+    ])]
+)
+compiled = compile_form(form)
+
+
+def answer(hidden, answers, question_id, value):
+    answers[question_id] = value
+    return compiled.conditions.update(hidden, answers, question_id)
+
+
+async def test_initial_hidden():
+    """До первого ответа скрыты вопросы с невыполненными условиями"""
+    hidden = compiled.initial_hidden()
+    assert hidden == [1, 2], hidden
+    assert compiled.visible_total(hidden) == 2
+    assert compiled.next_index(-1, hidden) == 0
+    assert compiled.next_index(0, hidden) == 3
+    assert compiled.question_number(3, hidden) == 2
+    return True
+
+
+async def test_show_and_hide():
+    """Ответ показывает зависимый вопрос, другой ответ снова его скрывает"""
+    answers = {}
+    hidden = answer(compiled.initial_hidden(), answers, 'a', ['o1'])
+    assert hidden == [2], hidden
+    assert compiled.next_index(0, hidden) == 1
+    hidden = answer(hidden, answers, 'a', ['o0'])
+    assert hidden == [1, 2], hidden
+    return True
+
+
+async def test_cascade():
+    """Скрытый вопрос скрывает вопросы, которые зависят от его ответа"""
+    answers = {}
+    hidden = answer(compiled.initial_hidden(), answers, 'a', ['o1'])
+    hidden = answer(hidden, answers, 'b', 'x')
+    assert hidden == [], hidden
+    # Ответ 'x' на b остается, но b скрыт, поэтому c тоже скрывается
+    hidden = answer(hidden, answers, 'a', ['o2'])
+    assert hidden == [1, 2], hidden
+    return True
+
+
+async def test_unknown_condition():
+    """Нераспознанное условие не скрывает вопрос"""
+    assert 3 not in compiled.conditions.rules
+    answers = {}
+    hidden = answer(compiled.initial_hidden(), answers, 'a', ['o0'])
+    assert 3 not in hidden
+    return True
+
+
+async def test_visible_answers():
+    """Ответы на вопросы, которые стали скрытыми, не отправляются"""
+    answers = {}
+    hidden = answer(compiled.initial_hidden(), answers, 'a', ['o1'])
+    hidden = answer(hidden, answers, 'b', 'x')
+    hidden = answer(hidden, answers, 'c', 'текст')
+    assert compiled.visible_answers(answers, hidden) == answers
+    hidden = answer(hidden, answers, 'a', ['o0'])
+    visible = compiled.visible_answers(answers, hidden)
+    assert visible == {'a': ['o0']}, visible
+    return True
+
+
+async def run_tests():
+    print("Запуск тестов условий показа вопросов...")
+    results = await asyncio.gather(
+        test_initial_hidden(),
+        test_show_and_hide(),
+        test_cascade(),
+        test_unknown_condition(),
+        test_visible_answers(),
+    )
+    if all(results):
+        print("Все тесты пройдены успешно!")
+    else:
+        print("Некоторые тесты не прошли")
+
+
+asyncio.run(run_tests())
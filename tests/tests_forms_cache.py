@@ -0,0 +1,67 @@
+import asyncio
+
+from services.forms import SchemaEntry, YandexForms
+from services.models import FormData, Page, Texts
+
+
+form = FormData(id='cached', name='Кэш',
+                texts=Texts(submit='Отправить', back='Назад', next='Далее'),
+                pages=[Page(items=[])])
+
+
+class SlowForms(YandexForms):
+    """Клиент без сети: загрузка структуры формы занимает `delay` секунд"""
+    def __init__(self, delay: float):
+        super().__init__(schema_ttl=60)
+        self.delay = delay
+        self.loads = 0
+
+    async def _load_form_data(self, survey_id, entry, session=None):
+        self.loads += 1
+        await asyncio.sleep(self.delay)
+        self._schemas[survey_id] = SchemaEntry(form, 'digest')
+        return form
+
+
+async def test_coalesced_loads():
+    """Одновременные запросы одной формы ждут одну загрузку"""
+    client = SlowForms(0.05)
+    results = await asyncio.gather(*(
+        client.get_form_data('cached') for _ in range(5)
+    ))
+    assert all(result is form for result in results)
+    assert client.loads == 1, client.loads
+    assert client.schema_stats['coalesced'] == 4
+    return True
+
+
+async def test_owner_cancelled():
+    """Отмена запроса-владельца не отменяет ожидающих"""
+    client = SlowForms(0.05)
+    owner = asyncio.create_task(client.get_form_data('cached'))
+    await asyncio.sleep(0.01)
+    waiters = [asyncio.create_task(client.get_form_data('cached'))
+               for _ in range(3)]
+    await asyncio.sleep(0.01)
+    owner.cancel()
+    results = await asyncio.gather(*waiters)
+    assert owner.cancelled()
+    assert all(result is form for result in results)
+    # Загрузку заново начал один из ожидающих
+    assert client.loads == 2, client.loads
+    return True
+
+
+async def run_tests():
+    print("Запуск тестов кэша структуры форм...")
+    results = await asyncio.gather(
+        test_coalesced_loads(),
+        test_owner_cancelled(),
+    )
+    if all(results):
+        print("Все тесты пройдены успешно!")
+    else:
+        print("Некоторые тесты не прошли")
+
+
+asyncio.run(run_tests())
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import tempfile
+
+from aiogram.fsm.storage.base import StorageKey
+
+from services.fsm_storage import RedisStorage, RespClient, SQLiteStorage
+from states.states import FormFilling
+
+
+key = StorageKey(bot_id=1, chat_id=100, user_id=100)
+session = {
+    'form_id': 'abc',
+    'form_version': '64c2b44f',
+    'current_index': 2,
+    'answers': {'q1': ['o1'], 'q2': 'Ответ'},
+}
+
+
+class RespStandIn:
+    """Локальная замена Redis: GET/SET/DEL/SELECT/AUTH/PING в памяти"""
+    def __init__(self):
+        self.values = {}
+        self.commands = []
+        self.server = None
+
+    @staticmethod
+    def reply(value) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if value == 'OK':
+            return b'+OK\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    async def handle(self, reader, writer):
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            args = []
+            for _ in range(int(header[1:-2])):
+                length = int((await reader.readline())[1:-2])
+                args.append((await reader.readexactly(length + 2))[:-2])
+            command = args[0].decode().upper()
+            self.commands.append(command)
+            if command == 'GET':
+                answer = self.reply(self.values.get(args[1]))
+            elif command == 'SET':
+                self.values[args[1]] = args[2]
+                answer = self.reply('OK')
+            elif command == 'DEL':
+                answer = self.reply(int(
+                    self.values.pop(args[1], None) is not None
+                ))
+            else:
+                answer = self.reply('OK')
+            writer.write(answer)
+            await writer.drain()
+        writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f'redis://:secret@127.0.0.1:{port}/1'
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def check_roundtrip(make_storage) -> bool:
+    storage = make_storage()
+    await storage.set_state(key, FormFilling.waiting_for_answers)
+    await storage.set_data(key, session)
+    assert await storage.get_data(key) == session
+    await storage.close()
+
+    # Новый экземпляр — как после перезапуска бота
+    storage = make_storage()
+    state = await storage.get_state(key)
+    data = await storage.get_data(key)
+    assert state == FormFilling.waiting_for_answers.state, state
+    assert data == session, data
+
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+    await storage.close()
+
+    storage = make_storage()
+    assert await storage.get_state(key) is None
+    assert await storage.get_data(key) == {}
+    await storage.close()
+    return True
+
+
+async def test_sqlite_storage():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fsm.sqlite3')
+        return await check_roundtrip(lambda: SQLiteStorage(path))
+
+
+async def test_redis_storage():
+    stand_in = RespStandIn()
+    url = await stand_in.start()
+    try:
+        result = await check_roundtrip(
+            lambda: RedisStorage(RespClient.from_url(url))
+        )
+        assert 'AUTH' in stand_in.commands
+        assert 'SELECT' in stand_in.commands
+        return result
+    finally:
+        await stand_in.stop()
+
+
+async def test_batched_writes():
+    """Много изменений подряд уходят на сервер одной пачкой"""
+    stand_in = RespStandIn()
+    url = await stand_in.start()
+    try:
+        storage = RedisStorage(RespClient.from_url(url), flush_interval=0.05)
+        for index in range(50):
+            await storage.update_data(key, {'current_index': index})
+        await asyncio.sleep(0.2)
+        sets = stand_in.commands.count('SET')
+        assert sets == 1, sets
+        await storage.close()
+        return True
+    finally:
+        await stand_in.stop()
+
+
+async def run_tests():
+    print("Запуск тестов хранилища FSM...")
+    results = await asyncio.gather(
+        test_sqlite_storage(),
+        test_redis_storage(),
+        test_batched_writes(),
+    )
+    if all(results):
+        print("Все тесты пройдены успешно!")
+    else:
+        print("Некоторые тесты не прошли")
+
+
+asyncio.run(run_tests())
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import services.tts as tts_module
+from services.tts import TTSService
+
+
+WORKERS = 4
+SYNTHESIS_SECONDS = 0.05
+synthesized = []
+
+
+def fake_synthesize_batch(requests):
+    """Синтез без модели: каждый текст занимает воркер на время"""
+    results = []
+    for text, _, _ in requests:
+        time.sleep(SYNTHESIS_SECONDS)
+        synthesized.append(text)
+        results.append(text.encode())
+    return results
+
+
+def create_service() -> TTSService:
+    service = TTSService(workers=WORKERS, batch_size=16, batch_wait=0.01)
+    service._executor = ThreadPoolExecutor(max_workers=WORKERS)
+    return service
+
+
+async def burst(service: TTSService, texts, batched: bool) -> float:
+    requests = [(text, 'xenia', 48000) for text in texts]
+    started = time.perf_counter()
+    if batched:
+        results = await asyncio.gather(*(
+            service.batcher.submit(request) for request in requests
+        ))
+    else:
+        results = await asyncio.gather(*(
+            service._synthesize_batch([request]) for request in requests
+        ))
+        results = [audio for audio, in results]
+    assert results == [text.encode() for text in texts]
+    return time.perf_counter() - started
+
+
+async def test_batched_burst_latency():
+    """Пакет из разных текстов не медленнее синтеза по одному"""
+    texts = [f'Вопрос {i}' for i in range(16)]
+    service = create_service()
+    try:
+        unbatched = await burst(service, texts, batched=False)
+        batched = await burst(service, texts, batched=True)
+    finally:
+        await service.shutdown()
+    # Окно сбора пакета и разброс планировщика потоков
+    assert batched <= unbatched * 1.25 + 0.05, (batched, unbatched)
+    return True
+
+
+async def test_batched_duplicates():
+    """Одинаковые тексты пакета синтезируются один раз"""
+    texts = ['Да', 'Нет'] * 8
+    service = create_service()
+    synthesized.clear()
+    try:
+        await burst(service, texts, batched=True)
+    finally:
+        await service.shutdown()
+    assert sorted(synthesized) == ['Да', 'Нет'], synthesized
+    return True
+
+
+async def run_tests():
+    print("Запуск тестов пакетного синтеза речи...")
+    tts_module._synthesize_batch = fake_synthesize_batch
+    results = [
+        await test_batched_burst_latency(),
+        await test_batched_duplicates(),
+    ]
+    if all(results):
+        print("Все тесты пройдены успешно!")
+    else:
+        print("Некоторые тесты не прошли")
+
+
+asyncio.run(run_tests())
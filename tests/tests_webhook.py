@@ -0,0 +1,93 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import create_app
+
+
+SECRET = 'test-secret'
+PATH = '/webhook'
+MAX_CONCURRENCY = 2
+
+received = []
+active = {'now': 0, 'max': 0}
+
+router = Router()
+
+
+@router.message()
+async def record_message(message: Message):
+    active['now'] += 1
+    active['max'] = max(active['max'], active['now'])
+    await asyncio.sleep(0.05)
+    received.append(message.text)
+    active['now'] -= 1
+
+
+def make_update(update_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': update_id, 'type': 'private'},
+            'from': {'id': update_id, 'is_bot': False, 'first_name': 'Тест'},
+            'text': text,
+        },
+    }
+
+
+async def make_client() -> TestClient:
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token='42:TEST')
+    app = create_app(dp, bot, PATH, SECRET, max_concurrency=MAX_CONCURRENCY)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client
+
+
+async def test_webhook():
+    client = await make_client()
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+    try:
+        # Без секрета обновление не принимается
+        resp = await client.post(PATH, json=make_update(1, 'чужой'))
+        assert resp.status == 401, resp.status
+
+        responses = await asyncio.gather(*[
+            client.post(PATH, json=make_update(i, f'ответ {i}'),
+                        headers=headers)
+            for i in range(2, 8)
+        ])
+        assert all(resp.status == 200 for resp in responses)
+
+        resp = await client.get('/healthz')
+        assert resp.status == 200
+        assert (await resp.json())['status'] == 'ok'
+
+        for _ in range(50):
+            if len(received) == 6:
+                break
+            await asyncio.sleep(0.05)
+
+        assert sorted(received) == sorted(f'ответ {i}' for i in range(2, 8))
+        assert 'чужой' not in received
+        assert active['max'] <= MAX_CONCURRENCY, active
+        return True
+    finally:
+        await client.close()
+
+
+async def run_tests():
+    print("Запуск тестов вебхука...")
+    results = await asyncio.gather(test_webhook())
+    if all(results):
+        print("Все тесты пройдены успешно!")
+    else:
+        print("Некоторые тесты не прошли")
+
+
+asyncio.run(run_tests())
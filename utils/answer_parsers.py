@@ -0,0 +1,192 @@
+import re
+from datetime import date
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+from services.models import FormItem
+from utils.constants import ANSWER_REJECTED, SAY_NO, SAY_YES
+from utils.fuzzy_index import OptionIndex
+
+
+# Причины, по которым ответ не принят (ключи `ANSWER_REJECTED`)
+NOT_A_NUMBER = 'not_a_number'
+OUT_OF_RANGE = 'out_of_range'
+UNKNOWN_OPTION = 'unknown_option'
+AMBIGUOUS = 'ambiguous'
+NOT_A_BOOLEAN = 'not_a_boolean'
+DATE_FORMAT = 'date_format'
+DATE_INVALID = 'date_invalid'
+
+NUMBERS = re.compile(r'\d+')
+# Несколько вариантов текстом: «среднее, высшее» или «среднее и высшее»
+OPTION_SEPARATORS = re.compile(r'[,;\n]|\s+и\s+')
+# 01.01.2023, 01/01/2023, 01-01-2023 или 2023-01-01 за один проход
+DATE = re.compile(
+    r'(?P<day>\d{1,2})(?P<sep>[./-])(?P<month>\d{1,2})(?P=sep)(?P<year>\d{4})'
+    r'|(?P<iso_year>\d{4})-(?P<iso_month>\d{1,2})-(?P<iso_day>\d{1,2})'
+)
+
+# Сколько подходящих вариантов перечислять, если ответ неоднозначен
+MAX_CANDIDATES = 5
+
+YES = frozenset(SAY_YES)
+NO = frozenset(SAY_NO)
+
+
+class ParseResult(NamedTuple):
+    value: Any = None
+    # None — ответ принят, иначе причина отказа
+    reason: Optional[str] = None
+    # Номера подходящих вариантов (с нуля), если ответ неоднозначен
+    candidates: Tuple[int, ...] = ()
+
+    @property
+    def ok(self) -> bool:
+        return self.reason is None
+
+
+class AnswerParser:
+    """Разбор ответа на вопрос без преобразования"""
+    __slots__ = ()
+
+    def parse(self, user_input: str) -> ParseResult:
+        return ParseResult(user_input)
+
+    def rejection_text(self, result: ParseResult) -> str:
+        return ANSWER_REJECTED[result.reason]
+
+
+class TextParser(AnswerParser):
+    __slots__ = ()
+
+    def parse(self, user_input: str) -> ParseResult:
+        return ParseResult(user_input.strip())
+
+
+class BooleanParser(AnswerParser):
+    __slots__ = ()
+
+    def parse(self, user_input: str) -> ParseResult:
+        text = user_input.lower().strip()
+        if text in YES:
+            return ParseResult(True)
+        if text in NO:
+            return ParseResult(False)
+        # Если ввод не распознан, пытаемся интерпретировать как число
+        try:
+            return ParseResult(bool(int(text)))
+        except ValueError:
+            return ParseResult(reason=NOT_A_BOOLEAN)
+
+
+class DateParser(AnswerParser):
+    __slots__ = ()
+
+    def parse(self, user_input: str) -> ParseResult:
+        match = DATE.fullmatch(user_input.strip())
+        if match is None:
+            return ParseResult(reason=DATE_FORMAT)
+        if match['year']:
+            parts = match['year'], match['month'], match['day']
+        else:
+            parts = match['iso_year'], match['iso_month'], match['iso_day']
+        try:
+            return ParseResult(date(*map(int, parts)).isoformat())
+        except ValueError:
+            return ParseResult(reason=DATE_INVALID)
+
+
+class ChoiceParser(AnswerParser):
+    """
+    Номер варианта (radio) или несколько номеров через любые разделители.
+
+    Если номеров нет, варианты ищутся по подписи (см. `OptionIndex`),
+    для нескольких вариантов — по частям ответа через запятую или «и».
+    """
+    __slots__ = ('option_ids', 'labels', 'multiple', 'index')
+
+    def __init__(self, option_ids: Tuple[str, ...], labels: Sequence[str],
+                 multiple: bool):
+        self.option_ids = option_ids
+        self.labels = tuple(labels)
+        self.multiple = multiple
+        self.index = OptionIndex(self.labels)
+
+    def _option(self, number: int) -> Optional[str]:
+        if 0 < number <= len(self.option_ids):
+            return self.option_ids[number - 1]
+        return None
+
+    def _match_labels(self, parts: List[str]) -> ParseResult:
+        selected = []
+        for part in parts:
+            if not part.strip():
+                continue
+            match = self.index.match(part)
+            if match.ambiguous:
+                return ParseResult(reason=AMBIGUOUS,
+                                   candidates=match.candidates)
+            if match.position is None:
+                return ParseResult(reason=UNKNOWN_OPTION)
+            option_id = self.option_ids[match.position]
+            if option_id not in selected:
+                selected.append(option_id)
+        if not selected:
+            return ParseResult(reason=NOT_A_NUMBER)
+        return ParseResult(selected)
+
+    def parse(self, user_input: str) -> ParseResult:
+        if not self.multiple:
+            try:
+                number = int(user_input)
+            except ValueError:
+                return self._match_labels([user_input])
+            option_id = self._option(number)
+            if option_id is None:
+                return ParseResult(reason=OUT_OF_RANGE)
+            return ParseResult([option_id])
+
+        numbers = NUMBERS.findall(user_input)
+        if not numbers:
+            return self._match_labels(OPTION_SEPARATORS.split(user_input))
+        selected = [
+            option_id for option_id in map(self._option, map(int, numbers))
+            if option_id is not None
+        ]
+        if not selected:
+            return ParseResult(reason=OUT_OF_RANGE)
+        return ParseResult(selected)
+
+    def rejection_text(self, result: ParseResult) -> str:
+        options = ', '.join(
+            f'{position + 1}. {self.labels[position]}'
+            for position in result.candidates[:MAX_CANDIDATES]
+        )
+        if len(result.candidates) > MAX_CANDIDATES:
+            options += ' и другие'
+        return ANSWER_REJECTED[result.reason].format(
+            count=len(self.option_ids), options=options
+        )
+
+
+TEXT_PARSER = TextParser()
+BOOLEAN_PARSER = BooleanParser()
+DATE_PARSER = DateParser()
+RAW_PARSER = AnswerParser()
+
+
+def compile_parser(question: FormItem) -> AnswerParser:
+    """Парсер ответа на вопрос, выбранный один раз по типу вопроса"""
+    if question.type == 'enum' and question.items:
+        return ChoiceParser(
+            tuple(option.id for option in question.items),
+            [option.label for option in question.items],
+            multiple=question.widget != 'radio',
+        )
+    if question.type == 'boolean':
+        return BOOLEAN_PARSER
+    if question.type == 'date':
+        return DATE_PARSER
+    if question.type == 'string':
+        return TEXT_PARSER
+    # Для других типов вопросов ответ сохраняется как есть
+    return RAW_PARSER
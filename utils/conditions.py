@@ -0,0 +1,147 @@
+from bisect import insort
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.models import Condition, FormItem
+
+
+EQUAL = {'eq', 'equal', 'equals', '=', '=='}
+NOT_EQUAL = {'neq', 'ne', 'not_equal', 'not_equals', '!='}
+
+# Условие на ответ: (id вопроса, отрицание, ожидаемое значение)
+Term = Tuple[str, bool, str]
+# Правило показа: ИЛИ по группам, в группе ИЛИ по цепочкам И;
+# None — условие не распознано, вопрос показывается всегда
+Rule = Optional[List[List[Term]]]
+
+
+def _compile_term(item) -> Optional[Term]:
+    condition = (item.condition or 'eq').lower()
+    if not item.question or item.value is None:
+        return None
+    if condition in EQUAL:
+        return item.question, False, item.value
+    if condition in NOT_EQUAL:
+        return item.question, True, item.value
+    return None
+
+
+def _compile_group(group: Condition) -> Optional[List[List[Term]]]:
+    """
+    Условия группы объединяются операторами элементов (у первого
+    элемента оператор не учитывается), по умолчанию — оператором
+    группы. И связывает сильнее ИЛИ.
+    """
+    chains: List[List[Term]] = [[]]
+    for position, item in enumerate(group.items):
+        term = _compile_term(item)
+        if term is None:
+            return None
+        operator = (item.operator or group.operator or 'and').lower()
+        if position and operator == 'or':
+            chains.append([])
+        chains[-1].append(term)
+    return [chain for chain in chains if chain]
+
+
+def compile_rule(conditions: Optional[List[Condition]]) -> Rule:
+    chains: List[List[Term]] = []
+    for group in conditions or []:
+        group_chains = _compile_group(group)
+        if group_chains is None:
+            return None
+        chains.extend(group_chains)
+    return chains or None
+
+
+def _matches(answer: Any, expected: str) -> bool:
+    if answer is None:
+        return False
+    if isinstance(answer, list):
+        return expected in answer
+    if isinstance(answer, bool):
+        return str(answer).lower() == str(expected).lower()
+    return str(answer) == str(expected)
+
+
+class ConditionEvaluator:
+    """
+    Условия показа вопросов формы, скомпилированные один раз.
+
+    Видимость хранится как отсортированный список индексов скрытых
+    вопросов. После ответа пересчитываются только вопросы, которые
+    зависят от этого ответа (и, цепочкой, от вопросов, чья видимость
+    изменилась). Ответы скрытых вопросов в условиях не учитываются.
+    Нераспознанные условия не скрывают вопрос.
+    """
+    def __init__(self, questions: List[FormItem]):
+        self.question_ids = [item.id for item in questions]
+        self.positions = {
+            question_id: index
+            for index, question_id in enumerate(self.question_ids)
+        }
+        self.rules: Dict[int, List[List[Term]]] = {}
+        self.dependents: Dict[str, List[int]] = defaultdict(list)
+        for index, item in enumerate(questions):
+            rule = compile_rule(item.conditions)
+            if rule is None:
+                continue
+            self.rules[index] = rule
+            for question_id in {term[0] for chain in rule for term in chain}:
+                self.dependents[question_id].append(index)
+        self._initial_hidden = self._evaluate_all()
+
+    @property
+    def has_conditions(self) -> bool:
+        return bool(self.rules)
+
+    def _is_visible(self, index: int, answers: Dict,
+                    hidden: Iterable[int]) -> bool:
+        for chain in self.rules[index]:
+            for question_id, negate, expected in chain:
+                position = self.positions.get(question_id)
+                answer = None
+                if position is not None and position not in hidden:
+                    answer = answers.get(question_id)
+                if _matches(answer, expected) == negate:
+                    break
+            else:
+                return True
+        return False
+
+    def _evaluate_all(self) -> List[int]:
+        hidden: Set[int] = set()
+        for index in sorted(self.rules):
+            if not self._is_visible(index, {}, hidden):
+                hidden.add(index)
+        return sorted(hidden)
+
+    def initial_hidden(self) -> List[int]:
+        """Скрытые вопросы до первого ответа"""
+        return list(self._initial_hidden)
+
+    def update(self, hidden: List[int], answers: Dict,
+               question_id: str) -> List[int]:
+        """Скрытые вопросы после ответа на `question_id`"""
+        pending = sorted(self.dependents.get(question_id, ()))
+        if not pending:
+            return hidden
+        hidden = list(hidden)
+        hidden_set = set(hidden)
+        while pending:
+            index = pending.pop(0)
+            visible = self._is_visible(index, answers, hidden_set)
+            if visible == (index not in hidden_set):
+                continue
+            if visible:
+                hidden_set.discard(index)
+                hidden.remove(index)
+            else:
+                hidden_set.add(index)
+                insort(hidden, index)
+            # Условия ссылаются на предыдущие вопросы, поэтому цепочка
+            # идет только вперед и не может зациклиться
+            for dependent in self.dependents.get(self.question_ids[index], ()):
+                if dependent > index and dependent not in pending:
+                    insort(pending, dependent)
+        return hidden
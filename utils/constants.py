@@ -68,19 +68,25 @@ PLEASE_COMPLETE = (
     '— Инструкция\n'
 )
 
+# Наборы кнопок неизменяемые: по ним кэшируются клавиатуры
 BUTTONS = {
-    'forms': ['Создать ссылку', 'Открыть форму'],
-    'start': ['Продолжить', 'Политика конфиденциальности'],
-    'id_forms': ['Скопировать', 'Создать новую ссылку'],
-    'privacy': ['Продолжить', 'Отказаться'],
-    'about': ['about'],
-    'form_intro': ['Заполнить форму', 'Инструкция', 'Отчет'],
-    'empty': [],
-    'submit': ['Отправить', 'Начать заново']
+    'forms': ('Создать ссылку', 'Открыть форму'),
+    'start': ('Продолжить', 'Политика конфиденциальности'),
+    'id_forms': ('Скопировать', 'Создать новую ссылку'),
+    'privacy': ('Продолжить', 'Отказаться'),
+    'about': ('about',),
+    'form_intro': ('Заполнить форму', 'Инструкция', 'Отчет'),
+    'empty': (),
+    'submit': ('Отправить', 'Начать заново')
 }
 
 NO_FORM_DATA = 'Ошибка: данные формы не найдены'
 
+FORM_CHANGED = (
+    '⚠️ Форма изменилась, пока вы ее заполняли. '
+    'Ответы сброшены, начнем с новой версии формы.'
+)
+
 COMPANY = 'НРООИ "Инватур"'
 
 REQUIRED_FIELD = ' (Обязательное поле)'
@@ -88,6 +94,14 @@ REQUIRED_FIELD = ' (Обязательное поле)'
 QUESTION_OK = '✅ Ответ сохранен!\n\n'
 
 OK = '✅ Форма успешно отправлена!'
+SUBMISSION_QUEUED = (
+    '📨 Ответы сохранены и отправляются. '
+    'Я сообщу, когда форма будет доставлена.'
+)
+SUBMISSION_DUPLICATE = (
+    '📨 Эти ответы уже отправлены. '
+    'Я сообщу, когда форма будет доставлена.'
+)
 NOT_OK = '❌ Ошибка при отправке: '
 
 BEGIN = '🚀 Начинаем заполнение формы!\n\n'
@@ -96,6 +110,39 @@ SAY_NO = ['нет', 'no', '0', 'false', '✗', '-', 'отказываюсь', '
 SAY_YES = ['да', 'yes', '1', 'true', '✓', '+', 'принимаю',
            'согласен', 'согласие']
 
+ANSWER_REJECTED = {
+    'not_a_number': '❌ Введите номер или название варианта ответа.',
+    'out_of_range': '❌ Нет варианта с таким номером. '
+                    'Введите число от 1 до {count}.',
+    'unknown_option': '❌ Не нашел такого варианта. '
+                      'Введите его номер от 1 до {count} или название.',
+    'ambiguous': '❓ Подходит несколько вариантов: {options}. '
+                 'Уточните ответ или введите номер.',
+    'not_a_boolean': '❌ Ответьте «да» или «нет».',
+    'date_format': '❌ Введите дату в формате ДД.ММ.ГГГГ, например 01.09.2024.',
+    'date_invalid': '❌ Такой даты не существует, проверьте день и месяц.',
+}
+
+# Тексты, которые озвучиваются при каждом запуске бота и кнопках меню.
+# Их аудио готовится заранее при старте.
+PREWARM_TEXTS = (HELP_TEXT, INSTRUCTION_TEXT, PRIVACY_TEXT, OK,
+                 SUBMISSION_QUEUED)
+# Начала сообщений с вопросами: озвучиваются только как фрагменты
+PREWARM_SEGMENTS = (BEGIN, QUESTION_OK)
+
+TTS_STATUS = {
+    'not_loaded': '⏳ Голосовой модуль еще не запущен, пока отвечаю текстом.',
+    'loading': '⏳ Голосовой модуль загружается, пока отвечаю текстом.',
+    'ready': '✅ Голосовой модуль готов.',
+    'failed': '❌ Голосовой модуль недоступен, отвечаю текстом.'
+}
+
+VOICE_ANSWER = {
+    'DISABLED': 'Распознавание голоса недоступно, напишите ответ текстом.',
+    'EMPTY': 'Не удалось разобрать ответ, повторите или напишите текстом.',
+    'RECOGNIZED': '🎙 Распознано: '
+}
+
 OUTPUT = {
     'OPEN': '❌ Сначала откройте форму с помощью кнопки "Открыть форму"',
     'WAIT': '⏳ Формируем отчет... Это может занять несколько секунд',
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import re
+import sys
+from typing import Dict, Optional, Tuple
+
+from config import config
+from services.forms import YandexForms, ya_forms
+from services.models import FormData
+from utils.form_utils import CompiledForm, cached_form, compile_form
+
+
+class FormRegistry:
+    """
+    Общий реестр форм, которые сейчас заполняют пользователи.
+
+    В данных сессии (FSM) хранятся только id и версия формы, сама форма
+    живет здесь в одном экземпляре на версию. Пока на версию ссылается
+    хотя бы одна сессия, она закреплена в реестре и не вытесняется
+    из кэша `compile_form`; после последнего `release` удаляется.
+    Если версии нет (перезапуск бота без сохраненных версий), сессия
+    не получает форму: ее индексы и ответы относятся к прежнему списку
+    вопросов, и подменять форму под ней нельзя.
+
+    С `directory` версии, на которые ссылаются сессии, сохраняются
+    на диск. Так воркеры и перезапущенный процесс находят ровно ту
+    версию формы, которую заполнял пользователь.
+    """
+    def __init__(self, client: YandexForms, directory: str = ''):
+        self.client = client
+        self.directory = directory
+        self._forms: Dict[Tuple[str, str], CompiledForm] = {}
+        self._refs: Dict[Tuple[str, str], int] = {}
+        self._saved: set = set()
+
+    def _path(self, form_id: str, version: str) -> str:
+        name = re.sub(r'[^\w-]', '_', f'{form_id}-{version}')
+        return os.path.join(self.directory, f'{name}.json')
+
+    def _save(self, compiled: CompiledForm) -> None:
+        path = self._path(compiled.form_id, compiled.version)
+        if os.path.exists(path):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(compiled.form.model_dump_json())
+        os.replace(tmp_path, path)
+
+    def _read_saved(self, form_id: str, version: str) -> Optional[FormData]:
+        try:
+            with open(self._path(form_id, version), encoding='utf-8') as file:
+                return FormData.model_validate_json(file.read())
+        except FileNotFoundError:
+            return None
+
+    async def load(self, form_id: str) -> CompiledForm:
+        """Актуальная версия формы"""
+        form_data = await self.client.get_form_data(form_id)
+        return compile_form(form_data)
+
+    async def get(self, form_id: str,
+                  version: str) -> Optional[CompiledForm]:
+        """Версия формы, с которой работает сессия; None — ее больше нет"""
+        compiled = (self._forms.get((form_id, version))
+                    or cached_form(form_id, version))
+        if compiled is None and self.directory:
+            form_data = await asyncio.to_thread(self._read_saved,
+                                                form_id, version)
+            if form_data is not None:
+                compiled = compile_form(form_data)
+        return compiled
+
+    async def for_session(self, data: Dict) -> Optional[CompiledForm]:
+        """
+        Форма из данных сессии FSM (`form_id`, `form_version`).
+        None, если форма не открыта или ее версия не найдена.
+        """
+        form_id = data.get('form_id')
+        if not form_id or not data.get('form_version'):
+            return None
+        return await self.get(str(form_id), data['form_version'])
+
+    async def acquire(self, compiled: CompiledForm) -> None:
+        """Сессия начала работать с этой версией формы"""
+        key = (compiled.form_id, compiled.version)
+        self._forms[key] = compiled
+        self._refs[key] = self._refs.get(key, 0) + 1
+        if self.directory and key not in self._saved:
+            await asyncio.to_thread(self._save, compiled)
+            self._saved.add(key)
+
+    def release(self, form_id: Optional[str],
+                version: Optional[str]) -> None:
+        """Сессия больше не ссылается на версию формы"""
+        key = (form_id, version)
+        refs = self._refs.get(key)
+        if refs is None:
+            return
+        if refs > 1:
+            self._refs[key] = refs - 1
+        else:
+            del self._refs[key]
+            del self._forms[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'forms': len(self._forms),
+            'sessions': sum(self._refs.values()),
+        }
+
+
+def _deep_sizeof(value, seen=None) -> int:
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_deep_sizeof(item, seen) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += _deep_sizeof(vars(value), seen)
+    return size
+
+
+def session_footprint(data: Dict) -> Dict[str, int]:
+    """
+    Сколько занимают данные одной сессии: в памяти процесса
+    и в сериализованном виде, как их сохранит хранилище FSM.
+    """
+    serialized = json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                            default=lambda obj: obj.model_dump())
+    return {
+        'object_bytes': _deep_sizeof(data),
+        'json_bytes': len(serialized.encode()),
+    }
+
+
+form_registry = FormRegistry(ya_forms, config.FORM_REGISTRY_DIR)
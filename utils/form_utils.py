@@ -1,145 +1,286 @@
-from typing import Dict, List, Tuple
+import hashlib
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from services.models import FormData, FormItem, Validation
+from utils.answer_parsers import AnswerParser, compile_parser
+from utils.conditions import ConditionEvaluator
+from utils.constants import REQUIRED_FIELD
 # from aiogram.fsm.context import FSMContext
 
 
-class FormNavigation:
+class CompiledForm:
+    """
+    Форма, подготовленная для быстрой работы обработчиков.
+
+    Строится один раз на версию формы (см. `compile_form`): вопрос по id,
+    вопрос по номеру, подпись варианта по его id, неизменные части
+    текста вопросов и парсеры ответов ищутся за O(1), без обхода
+    страниц формы.
+
+    Вопросы с условиями показа скрываются по ответам (см.
+    `ConditionEvaluator`). Скрытые вопросы передаются в методы
+    отсортированным списком индексов `hidden`: номер вопроса и их
+    общее число считаются по видимым вопросам.
+    """
     def __init__(self, form_data: FormData):
-        self.form_data = form_data
-        self.visible_questions = self._get_visible_questions()
-        self.current_question_index = 0
-
-    def _get_visible_questions(self) -> List[Tuple[int, int, FormItem]]:
-        """
-        Возвращает список видимых вопросов
-        в формате (page_index, item_index, item)
-        """
-        visible_questions = []
-        for page_idx, page in enumerate(self.form_data.pages):
+        self.form = form_data
+        self.form_id = form_data.id
+        self.version = form_version(form_data)
+        self.items: Dict[str, FormItem] = {}
+        self.visible_questions: List[Tuple[int, int, FormItem]] = []
+        for page_idx, page in enumerate(form_data.pages):
             for item_idx, item in enumerate(page.items):
+                self.items[item.id] = item
                 if not item.hidden:
-                    visible_questions.append((page_idx, item_idx, item))
-        return visible_questions
-
-    def get_current_question(self) -> Tuple[int, int, FormItem]:
-        """Возвращает текущий вопрос"""
-        if self.current_question_index < len(self.visible_questions):
-            return self.visible_questions[self.current_question_index]
+                    self.visible_questions.append((page_idx, item_idx, item))
+
+        self.questions: List[FormItem] = [
+            item for _, _, item in self.visible_questions
+        ]
+        self.question_ids: List[str] = [item.id for item in self.questions]
+        self.positions: Dict[str, int] = {
+            question_id: index
+            for index, question_id in enumerate(self.question_ids)
+        }
+        self.option_labels: Dict[str, Dict[str, str]] = {
+            item.id: {option.id: option.label for option in item.items}
+            for item in self.questions if item.items
+        }
+        self.required: List[bool] = [
+            is_required(item.validations or []) for item in self.questions
+        ]
+        self._body_segments: List[List[str]] = [
+            _question_body_segments(item) for item in self.questions
+        ]
+        self.parsers: List[AnswerParser] = [
+            compile_parser(item) for item in self.questions
+        ]
+        self.conditions = ConditionEvaluator(self.questions)
+        self.overview = self._render_overview()
+
+    @property
+    def total_questions(self) -> int:
+        return len(self.questions)
+
+    def initial_hidden(self) -> List[int]:
+        """Вопросы, скрытые условиями до первого ответа"""
+        return self.conditions.initial_hidden()
+
+    def visible_total(self, hidden: List[int] = ()) -> int:
+        return len(self.questions) - len(hidden)
+
+    def question_number(self, index: int, hidden: List[int] = ()) -> int:
+        """Номер вопроса среди видимых, с единицы"""
+        return index + 1 - bisect_left(hidden, index)
+
+    def next_index(self, index: int, hidden: List[int] = ()) -> Optional[int]:
+        """Следующий видимый вопрос после `index` (-1 — первый)"""
+        index += 1
+        while index < len(self.questions):
+            if not _contains(hidden, index):
+                return index
+            index += 1
         return None
 
-    def get_next_question(self) -> Tuple[int, int, FormItem]:
-        """Переходит к следующему вопросу и возвращает его"""
-        if self.current_question_index < len(self.visible_questions) - 1:
-            self.current_question_index += 1
-            return self.visible_questions[self.current_question_index]
+    def previous_index(self, index: int,
+                       hidden: List[int] = ()) -> Optional[int]:
+        index -= 1
+        while index >= 0:
+            if not _contains(hidden, index):
+                return index
+            index -= 1
         return None
 
-    def get_previous_question(self) -> Tuple[int, int, FormItem]:
-        """Переходит к предыдущему вопросу и возвращает его"""
-        if self.current_question_index > 0:
-            self.current_question_index -= 1
-            return self.visible_questions[self.current_question_index]
-        return None
-
-    def get_question_by_index(self, index: int) -> Tuple[int, int, FormItem]:
-        """Возвращает вопрос по индексу"""
-        if 0 <= index < len(self.visible_questions):
-            self.current_question_index = index
-            return self.visible_questions[index]
-        return None
-
-    def is_last_question(self) -> bool:
-        """Проверяет, является ли текущий вопрос последним"""
-        return self.current_question_index == len(self.visible_questions) - 1
-
-    def get_total_questions(self) -> int:
-        """Возвращает общее количество вопросов"""
-        return len(self.visible_questions)
+    def question_segments(self, index: int,
+                          hidden: List[int] = ()) -> List[str]:
+        """Части текста вопроса с индексом `index` (с нуля)"""
+        header = _question_header(self.question_number(index, hidden),
+                                  self.visible_total(hidden),
+                                  self.required[index])
+        return [header, *self._body_segments[index]]
+
+    def question_text(self, index: int, hidden: List[int] = ()) -> str:
+        return ''.join(self.question_segments(index, hidden))
+
+    def visible_answers(self, answers: Dict, hidden: List[int]) -> Dict:
+        """Ответы без вопросов, которые скрыты условиями"""
+        if not hidden:
+            return answers
+        hidden_ids = {self.question_ids[index] for index in hidden}
+        return {question_id: answer
+                for question_id, answer in answers.items()
+                if question_id not in hidden_ids}
+
+    def answer_labels(self, question_id: str, choice_ids: List[str]) -> List[str]:
+        """Подписи выбранных вариантов ответа"""
+        labels = self.option_labels.get(question_id, {})
+        return [labels[choice_id] for choice_id in choice_ids
+                if choice_id in labels]
+
+    def _render_overview(self) -> str:
+        """Список вопросов для знакомства с формой"""
+        lines = []
+        hidden = set(self.initial_hidden())
+        number = 0
+        for index, item in enumerate(self.questions):
+            if index in hidden:
+                continue
+            number += 1
+            line = f'{number}. {item.label}'
+            if self.required[index]:
+                line += REQUIRED_FIELD
+            line += '\n'
+            if item.comment:
+                line += f'<i>{item.comment}</i>\n'
+            lines.append(line + '\n')
+        return ''.join(lines)
+
+
+def _contains(ordered: List[int], value: int) -> bool:
+    position = bisect_left(ordered, value)
+    return position < len(ordered) and ordered[position] == value
+
+
+COMPILED_FORMS_CACHE_SIZE = 64
+_compiled_forms: 'OrderedDict[Tuple[str, str], CompiledForm]' = OrderedDict()
+
+
+def form_version(form_data: FormData) -> str:
+    """
+    Версия структуры формы. Клиент форм проставляет ее по хэшу ответа
+    API, для форм из других источников она считается один раз.
+    """
+    if form_data.version is None:
+        form_data.version = hashlib.sha256(
+            form_data.model_dump_json().encode()
+        ).hexdigest()
+    return form_data.version
+
+
+def cached_form(form_id: str, version: str) -> Optional[CompiledForm]:
+    """Уже построенная версия формы, если она еще в кэше"""
+    return _compiled_forms.get((form_id, version))
+
+
+def compile_form(form_data: FormData) -> CompiledForm:
+    """Возвращает `CompiledForm` из кэша или строит его для новой версии"""
+    key = (form_data.id, form_version(form_data))
+    compiled = _compiled_forms.get(key)
+    if compiled is not None:
+        _compiled_forms.move_to_end(key)
+        return compiled
+
+    compiled = CompiledForm(form_data)
+    _compiled_forms[key] = compiled
+    while len(_compiled_forms) > COMPILED_FORMS_CACHE_SIZE:
+        _compiled_forms.popitem(last=False)
+    return compiled
 
 
 def is_required(validations: list[Validation]) -> bool:
     return any(item.type == 'required' for item in validations)
 
 
-def format_question_text(question: FormItem, question_number: int,
-                         total_questions: int) -> str:
-    """Форматирует текст вопроса"""
-    is_required = any(validation.type == 'required' for validation in (
-        question.validations or []))
+def _question_header(question_number: int, total_questions: int,
+                     required: bool) -> str:
+    header = f"Вопрос {question_number}/{total_questions}"
+    if required:
+        header += " (обязательный вопрос)"
+    return header + "\n"
 
-    question_text = f"Вопрос {question_number}/{total_questions}"
-    if is_required:
-        question_text += " (обязательный вопрос)"
-    question_text += f"\n{question.label}\n"
+
+def _question_body_segments(question: FormItem) -> List[str]:
+    """Части текста вопроса, не зависящие от его номера"""
+    segments = [f"{question.label}\n"]
 
     if question.comment:
-        question_text += f"<i>{question.comment}</i>\n"
+        segments.append(f"<i>{question.comment}</i>\n")
 
     # Вопрос с выбором варианта (enum)
     if question.type == 'enum' and question.items:
-        question_text += "\nВарианты ответов:\n"
+        segments.append("\nВарианты ответов:\n")
         for i, option in enumerate(question.items, 1):
-            question_text += f"{i}. {option.label}\n"
+            segments.append(f"{i}. {option.label}\n")
 
         # Инструкция в зависимости от типа виджета
         if question.widget == 'radio':
-            question_text += "\nНапишите номер одного выбранного варианта"
+            segments.append("\nНапишите номер одного выбранного варианта")
         elif question.widget == 'checkbox':
-            question_text += "\nНапишите номера выбранных вариантов через пробел (например: 1 3 5)"
+            segments.append("\nНапишите номера выбранных вариантов через пробел (например: 1 3 5)")
         else:  # по умолчанию
-            question_text += "\nНапишите номер выбранного варианта"
+            segments.append("\nНапишите номер выбранного варианта")
 
     # Булевый вопрос (флажок)
     elif question.type == 'boolean':
-        question_text += "\nОтветьте 'да' или 'нет'"
+        segments.append("\nОтветьте 'да' или 'нет'")
 
     elif question.type == 'date':
-        question_text += "\nВведите дату в формате ДД.ММ.ГГГГ (например: 01.01.2023)"
+        segments.append("\nВведите дату в формате ДД.ММ.ГГГГ (например: 01.01.2023)")
 
     # Текстовый вопрос
     elif question.type == 'string':
         if question.multiline:
-            question_text += "\n(введите текст, можно несколько строк)"
+            segments.append("\n(введите текст, можно несколько строк)")
         else:
-            question_text += "\n(введите текст)"
+            segments.append("\n(введите текст)")
+
+    return segments
+
+
+def format_question_segments(question: FormItem, question_number: int,
+                             total_questions: int) -> List[str]:
+    """
+    Разбивает текст вопроса на части, которые озвучиваются отдельно.
+
+    Меняется между пользователями и шагами только заголовок
+    "Вопрос N/M", остальные части (формулировка, варианты, инструкция)
+    одинаковы и синтезируются один раз. Склеенные части дают
+    ровно `format_question_text`.
+    """
+    header = _question_header(question_number, total_questions,
+                              is_required(question.validations or []))
+    return [header, *_question_body_segments(question)]
 
-    return question_text
+
+def format_question_text(question: FormItem, question_number: int,
+                         total_questions: int) -> str:
+    """Форматирует текст вопроса"""
+    return ''.join(format_question_segments(
+        question, question_number, total_questions
+    ))
 
 
 def create_answer_structure(form_data: FormData, answers: Dict) -> Dict:
     """Создает структуру ответов для отправки в Яндекс.Формы"""
     result = {}
 
-    for page in form_data.pages:
-        for item in page.items:
-            if not item.hidden and item.id in answers:
-                if item.type == 'enum':
-                    result[item.id] = {"choices": answers[item.id]}
-                else:
-                    result[item.id] = {"text": answers[item.id]}
+    for item in compile_form(form_data).questions:
+        if item.id in answers:
+            if item.type == 'enum':
+                result[item.id] = {"choices": answers[item.id]}
+            else:
+                result[item.id] = {"text": answers[item.id]}
     return result
 
 
-async def format_confirmation_message(form_data: FormData, answers: Dict) -> str:
+async def format_confirmation_message(form_data: FormData, answers: Dict,
+                                      hidden: List[int] = ()) -> str:
     """Форматирует сообщение с подтверждением ответов"""
+    compiled = compile_form(form_data)
     message = "✅ Все вопросы пройдены!\n\n"
     message += "Проверьте ваши ответы:\n\n"
 
-    question_number = 1
-    for page in form_data.pages:
-        for item in page.items:
-            if not item.hidden:
-                answer = answers.get(item.id, "Не отвечено")
-                if item.type == 'enum' and item.items and isinstance(answer, list):
-                    option_labels = []
-                    for choice_id in answer:
-                        option = next((opt for opt in item.items if opt.id == choice_id), None)
-                        if option:
-                            option_labels.append(option.label)
-                    answer = ", ".join(option_labels) if option_labels else "Не выбрано"
-
-                message += f"{question_number}. {item.label}: {answer}\n"
-                question_number += 1
+    hidden = set(hidden)
+    visible = [item for index, item in enumerate(compiled.questions)
+               if index not in hidden]
+    for question_number, item in enumerate(visible, 1):
+        answer = answers.get(item.id, "Не отвечено")
+        if item.type == 'enum' and item.items and isinstance(answer, list):
+            option_labels = compiled.answer_labels(item.id, answer)
+            answer = ", ".join(option_labels) if option_labels else "Не выбрано"
+
+        message += f"{question_number}. {item.label}: {answer}\n"
 
     message += "\nВы можете отправить результаты прямо сейчас.\n"
     message += "Если хотите заполнить форму заново, выберите опцию \"Начать заново\"."
@@ -147,14 +288,15 @@ async def format_confirmation_message(form_data: FormData, answers: Dict) -> str
     return message
 
 
-def get_keyboard_for_question(is_first: bool, is_last: bool) -> list:
+def get_keyboard_for_question(is_first: bool,
+                              is_last: bool) -> Tuple[str, ...]:
     """Возвращает клавиатуру для вопроса"""
     if is_first:
-        return ['Заполнить форму']
+        return ('Заполнить форму',)
     elif is_last:
-        return ['Назад', 'Показать все ответы']
+        return ('Назад', 'Показать все ответы')
     else:
-        return ['Назад']
+        return ('Назад',)
 
 
 def get_intro_form_header(title: str, company: str, questions_count: int):
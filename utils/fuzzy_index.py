@@ -0,0 +1,106 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+
+WORD = re.compile(r'\w+')
+
+# Минимальная доля триграмм ответа, найденных в подписи варианта
+MIN_SCORE = 0.5
+# Если второй вариант отстает меньше, чем на столько, ответ неоднозначен
+AMBIGUITY_MARGIN = 0.15
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр без «ё» и знаков препинания"""
+    return ' '.join(WORD.findall(text.casefold().replace('ё', 'е')))
+
+
+def trigrams(text: str) -> Set[str]:
+    """Триграммы слов нормализованного текста с границами слов"""
+    grams = set()
+    for word in text.split():
+        padded = f' {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FuzzyMatch(NamedTuple):
+    # Номер найденного варианта (с нуля) или None
+    position: Optional[int] = None
+    score: float = 0.0
+    # Близкие по похожести варианты, если однозначного нет
+    candidates: Tuple[int, ...] = ()
+
+    @property
+    def ambiguous(self) -> bool:
+        return self.position is None and bool(self.candidates)
+
+
+class OptionIndex:
+    """
+    Поиск варианта ответа по свободному тексту.
+
+    Строится один раз на вопрос: подписи вариантов нормализуются
+    (`normalize`) и раскладываются в обратный индекс по триграммам.
+    Ответ сравнивается только с вариантами, у которых есть общие
+    триграммы, поэтому поиск почти не зависит от числа вариантов.
+    Триграммы прощают опечатки и окончания, распознанные голосом.
+    """
+    __slots__ = ('exact', 'postings', 'words', 'vocabulary')
+
+    def __init__(self, labels: Sequence[str]):
+        self.exact: Dict[str, List[int]] = {}
+        postings: Dict[str, List[int]] = {}
+        self.words: List[frozenset] = []
+        for position, label in enumerate(labels):
+            text = normalize(label)
+            self.exact.setdefault(text, []).append(position)
+            self.words.append(frozenset(text.split()))
+            for gram in trigrams(text):
+                postings.setdefault(gram, []).append(position)
+        self.vocabulary = frozenset().union(*self.words)
+        self.postings: Dict[str, Tuple[int, ...]] = {
+            gram: tuple(positions) for gram, positions in postings.items()
+        }
+
+    def match(self, user_input: str) -> FuzzyMatch:
+        text = normalize(user_input)
+        if not text:
+            return FuzzyMatch()
+        exact = self.exact.get(text)
+        if exact is not None:
+            if len(exact) == 1:
+                return FuzzyMatch(exact[0], 1.0)
+            return FuzzyMatch(score=1.0, candidates=tuple(exact))
+
+        grams = trigrams(text)
+        common: Dict[int, int] = {}
+        for gram in grams:
+            for position in self.postings.get(gram, ()):
+                common[position] = common.get(position, 0) + 1
+        if not common:
+            return FuzzyMatch()
+
+        # Доля триграмм ответа, которые есть в подписи варианта: короткий
+        # ответ, целиком входящий в несколько подписей, неоднозначен
+        best_shared = max(common.values())
+        best_score = best_shared / len(grams)
+        if best_score < MIN_SCORE:
+            return FuzzyMatch(score=best_score)
+        threshold = (best_score - AMBIGUITY_MARGIN) * len(grams)
+        close = sorted(
+            position for position, shared in common.items()
+            if shared > threshold
+        )
+        if len(close) > 1:
+            # Из похожих выигрывает единственный вариант, в котором есть
+            # все известные слова ответа: «№ 17» не путается с «№ 170»,
+            # даже если в остальных словах опечатка
+            words = self.vocabulary.intersection(text.split())
+            whole = [position for position in close
+                     if words <= self.words[position]]
+            if len(whole) != 1:
+                return FuzzyMatch(score=best_score,
+                                  candidates=tuple(whole or close))
+            close = whole
+        return FuzzyMatch(close[0], best_score)
@@ -1,21 +1,139 @@
+import asyncio
+import hashlib
 import re
-from services.silero import silero
+from typing import Coroutine, List, Optional, Sequence, Set
+from config import config
+from services.file_ids import voice_file_ids
+from services.tts import tts
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, BufferedInputFile
-from keyboard.reply_kb import MainKb
+from keyboard.reply_kb import reply_keyboard
+from utils.constants import BUTTONS, NOT_OK, OK
+from utils.text_utils import split_into_chunks
 
 
 async def send_voice_message(message: Message,
                              text: str,
                              filename: str,
-                             keyboard_buttons: list):
-    audio_bytes = silero.text_to_speech(text=text)
+                             keyboard_buttons: Sequence[str],
+                             segments: Optional[List[str]] = None):
+    """Отвечает на сообщение текстом и его озвучкой"""
+    await send_voice_to_chat(message.bot, message.chat.id, text,
+                             filename, keyboard_buttons, segments)
+
+
+async def send_voice_to_chat(bot: Bot,
+                             chat_id: int,
+                             text: str,
+                             filename: str,
+                             keyboard_buttons: Sequence[str],
+                             segments: Optional[List[str]] = None):
+    """
+    Отправляет в чат текст и его озвучку.
+
+    Если переданы `segments` (части, из которых составлен `text`),
+    аудио собирается из отдельно закэшированных фрагментов. Длинный
+    текст без `segments` отправляется несколькими голосовыми сообщениями.
+    Пока модель TTS не загружена, отправляется только текст.
+    """
+    keyboard = reply_keyboard(keyboard_buttons)
+    if not tts.is_ready:
+        await bot.send_message(chat_id, text=text, reply_markup=keyboard)
+        return
+
+    if segments:
+        audio_bytes = await tts.segments_to_speech(segments)
+        await bot.send_message(chat_id, text=text)
+        await send_voice(bot, chat_id, audio_bytes, filename, keyboard)
+        return
+
+    chunks = get_voice_chunks(text)
+    if len(chunks) == 1:
+        audio_bytes = await tts.text_to_speech(text=text)
+        await bot.send_message(chat_id, text=text)
+        await send_voice(bot, chat_id, audio_bytes, filename, keyboard)
+        return
+
+    # Длинный текст озвучивается частями: первая часть уходит сразу,
+    # остальные догоняют ее по порядку
+    await bot.send_message(chat_id, text=text)
+    part = 0
+    async for audio_bytes in tts.stream(chunks):
+        part += 1
+        await send_voice(
+            bot, chat_id, audio_bytes, f'{part}_{filename}', keyboard
+        )
+
+
+def get_voice_chunks(text: str) -> List[str]:
+    """
+    Возвращает тексты, которые будут озвучены для `text`: сам текст,
+    если он короткий, или его части по предложениям.
+    """
+    # Короткий текст (большинство сообщений) не разбирается на предложения
+    if len(text) <= config.TTS_CHUNK_CHARS:
+        return [text]
+    chunks = split_into_chunks(text, config.TTS_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return [text]
+    return chunks
+
+
+async def send_voice(bot: Bot, chat_id: int, audio_bytes: bytes,
+                     filename: str, reply_markup):
+    """
+    Отправляет голосовое сообщение, по возможности без повторной загрузки.
+
+    Если это аудио уже отправлялось, используется сохраненный `file_id`.
+    Если Telegram его не принимает, файл загружается заново.
+    """
+    audio_hash = hashlib.sha256(audio_bytes).hexdigest()
+    file_id = await voice_file_ids.get(audio_hash)
+    if file_id:
+        try:
+            return await bot.send_voice(
+                chat_id,
+                voice=file_id,
+                reply_markup=reply_markup
+            )
+        except TelegramBadRequest:
+            await voice_file_ids.discard(audio_hash)
 
     voice_input_file = BufferedInputFile(audio_bytes, filename=filename)
-    await message.answer(text=text)
-    await message.answer_voice(
+    sent = await bot.send_voice(
+        chat_id,
         voice=voice_input_file,
-        reply_markup=MainKb(keyboard_buttons).get_keyboard()
+        reply_markup=reply_markup
     )
+    if sent.voice:
+        await voice_file_ids.set(audio_hash, sent.voice.file_id)
+    return sent
+
+
+async def notify_submission(bot: Bot, chat_id: int, delivered: bool,
+                            error: Optional[str]):
+    """Сообщает пользователю, дошли ли его ответы до Яндекс Форм"""
+    if delivered:
+        await send_voice_to_chat(bot, chat_id, OK,
+                                 'OK.wav', BUTTONS['start'])
+    else:
+        await send_voice_to_chat(bot, chat_id, NOT_OK + str(error),
+                                 'NOT_OK.wav', BUTTONS['start'])
+
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def run_in_background(coro: Coroutine) -> asyncio.Task:
+    """
+    Запускает корутину в фоне, не задерживая обработчик.
+    Ссылка на задачу хранится, пока она не завершится.
+    """
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
 
 def get_form_id(url: str):
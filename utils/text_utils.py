@@ -0,0 +1,60 @@
+import re
+from typing import List
+
+
+# Точка после цифры — это нумерация ("1. Введение"), а не конец предложения
+SENTENCE_END = re.compile(r'(?<=\D[.!?…])\s+|\n+')
+SOFT_BREAK = re.compile(r'(?<=[,;:—])\s+|\s+')
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Делит слишком длинное предложение по запятым и пробелам."""
+    parts = []
+    current = ''
+    for piece in SOFT_BREAK.split(sentence):
+        if not piece:
+            continue
+        candidate = f'{current} {piece}' if current else piece
+        if len(candidate) <= max_chars or not current:
+            current = candidate
+        else:
+            parts.append(current)
+            current = piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_chunks(text: str, max_chars: int = 500) -> List[str]:
+    """
+    Делит текст для озвучивания на части по границам предложений.
+
+    Первая часть — одно предложение, чтобы первое голосовое сообщение
+    было готово как можно раньше. Остальные предложения собираются
+    в части не длиннее `max_chars` символов.
+    """
+    sentences = []
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) > max_chars:
+            sentences.extend(_split_long(sentence, max_chars))
+        else:
+            sentences.append(sentence)
+
+    if not sentences:
+        return []
+
+    chunks = [sentences[0]]
+    current = ''
+    for sentence in sentences[1:]:
+        candidate = f'{current}\n{sentence}' if current else sentence
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = sentence
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import (SimpleRequestHandler,
+                                            setup_application)
+from aiohttp import web
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Прием обновлений через вебхук с ограничением одновременной обработки.
+
+    Telegram сразу получает ответ 200, а обновление обрабатывается в фоне.
+    Одновременно обрабатывается не больше `max_concurrency` обновлений:
+    следующий запрос ждет свободного места, прежде чем ответить Telegram,
+    и тот сам замедляет доставку.
+    """
+    def __init__(self, dispatcher: Dispatcher, bot: Bot,
+                 max_concurrency: int = 64, **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True,
+                         **kwargs)
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def _handle_request_background(self, bot: Bot,
+                                         request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        task = asyncio.create_task(
+            self._background_feed_update(bot=bot, update=update)
+        )
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._finish_update)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def _finish_update(self, task: asyncio.Task) -> None:
+        self._background_feed_update_tasks.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Ошибка обработки обновления',
+                         exc_info=task.exception())
+
+
+def webhook_secret() -> str:
+    """
+    Секрет вебхука: `WEBHOOK_SECRET` или производный от токена бота,
+    одинаковый во всех процессах.
+    """
+    if config.WEBHOOK_SECRET:
+        return config.WEBHOOK_SECRET
+    return hashlib.sha256(config.BOT_TOKEN.encode()).hexdigest()
+
+
+def create_app(dp: Dispatcher, bot: Bot, path: str, secret_token: str,
+               max_concurrency: int = 64, **data: Any) -> web.Application:
+    """aiohttp-приложение с вебхуком на `path` и проверкой `/healthz`"""
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, max_concurrency=max_concurrency,
+                                    secret_token=secret_token, **data)
+    handler.register(app, path=path)
+
+    async def healthz(request: web.Request) -> web.Response:
+        status: Dict[str, Any] = {
+            'status': 'ok',
+            'in_flight': handler.in_flight,
+        }
+        return web.json_response(status)
+
+    app.router.add_get('/healthz', healthz)
+    setup_application(app, dp, bot=bot, **data)
+    return app
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    """Сообщает Telegram адрес вебхука при запуске"""
+    await bot.set_webhook(
+        url=config.WEBHOOK_BASE_URL.rstrip('/') + config.WEBHOOK_PATH,
+        secret_token=webhook_secret(),
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+    )
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Запускает HTTP-сервер и принимает обновления до остановки"""
+    dp.startup.register(set_webhook)
+    app = create_app(dp, bot, config.WEBHOOK_PATH, webhook_secret(),
+                     max_concurrency=config.WEBHOOK_MAX_CONCURRENCY)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info('Вебхук слушает %s:%s%s', config.WEBHOOK_HOST,
+                config.WEBHOOK_PORT, config.WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()